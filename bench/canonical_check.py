@@ -0,0 +1,81 @@
+"""
+入力の正規化（lib.canonical.canonicalize）によるキャッシュのヒット率の比較
+
+data/query_log.txt の問い合わせ（1行1件）を前から順にキャッシュに入れた時の
+ヒット率を、前後の空白を除いただけの場合と正規化した場合で比べる。
+あわせて正規化の結果を確認し、一致しないものがあれば終了コード1で終わる。
+
+data/query_log.txt は実際の利用の記録ではなく、10個の用語を表記の揺れ
+（空白、全角・半角、末尾の句読点や助詞）を付けて入力した500件を生成したもの。
+
+    python bench/canonical_check.py [--log data/query_log.txt]
+"""
+
+import argparse
+import importlib
+import os
+import sys
+
+import run
+
+QUERY_LOG_PATH = os.path.join(run.BENCH_DIR, "data", "query_log.txt")
+
+# (入力, 正規化の結果)
+CASES = (
+    ("顧客 情報を", "顧客 情報"),
+    ("顧客　情報。", "顧客 情報"),
+    ("商品ｺｰﾄﾞ", "商品コード"),
+    ("ユーザーＩＤを", "ユーザーID"),
+    ("在庫数は。", "在庫数"),
+    ("人々が", "人々"),
+    ("取得日時\n\n注文履歴を", "取得日時\n注文履歴"),
+    # ひらがなの語の末尾は助詞として取り除かない
+    ("はは", "はは"),
+    ("しょうが", "しょうが"),
+    ("ながさ", "ながさ"),
+    ("を", "を"),
+)
+
+# 問い合わせを前から順に処理した時のキャッシュのヒット率
+def hit_rate(queries, normalize):
+    seen = set()
+    hits = 0
+    total = 0
+    for query in queries:
+        key = normalize(query)
+        if not key:
+            continue
+        total += 1
+        if key in seen:
+            hits += 1
+        else:
+            seen.add(key)
+    return hits, total
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the cache hit rate with and without input canonicalization.")
+    parser.add_argument("--log", default=QUERY_LOG_PATH, help="one query per line")
+    args = parser.parse_args(argv)
+
+    run.load_plugin_class()
+    canonical = importlib.import_module("Codic.lib.canonical")
+    with open(args.log, "r", encoding="utf-8") as file:
+        queries = file.read().splitlines()
+
+    print("queries: {}".format(len(queries)))
+    for name, normalize in (("strip only", str.strip), ("canonicalized", canonical.canonicalize)):
+        hits, total = hit_rate(queries, normalize)
+        print("hit rate ({}): {:.1%} ({} misses)".format(name, hits / total if total else 0.0, total - hits))
+
+    failures = []
+    for text, expected in CASES:
+        actual = canonical.canonicalize(text)
+        if actual != expected:
+            failures.append("{!r}: expected {!r}, got {!r}".format(text, expected, actual))
+    for failure in failures:
+        print("FAIL " + failure)
+    print("{} of {} canonical forms match.".format(len(CASES) - len(failures), len(CASES)))
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
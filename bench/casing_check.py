@@ -0,0 +1,97 @@
+"""
+ローカルのケース変換（lib.api.render_result）とCodic APIのケース変換の一致確認
+
+data/casing_fixtures.json のケース指定なしの結果を全てのケースと頭字語の書き方で
+ローカルに変換し、期待値と比べる。一致しないものがあれば終了コード1で終わる。
+--record を付けると、同じ入力を実際のAPIにケース毎に問い合わせて期待値を記録し直す。
+
+    python bench/casing_check.py
+    python bench/casing_check.py --record --token YOUR_ACCESS_TOKEN
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_PATH = os.path.join(BENCH_DIR, "data", "casing_fixtures.json")
+sys.path.insert(0, BENCH_DIR)
+
+import run
+
+# 確認するケースと頭字語の書き方の組（頭字語の書き方の指定なしも含む）
+def iter_styles(api):
+    yield "", ""
+    for casing in api.CASING_DICT.keys():
+        acronym_styles = [""] + list(api.ACRONYM_STYLE_DICT.keys()) if casing in api.ACRONYM_CASINGS else [""]
+        for acronym_style in acronym_styles:
+            yield casing, acronym_style
+
+def style_name(casing, acronym_style):
+    if not casing:
+        return "none"
+    return "{}/{}".format(casing, acronym_style) if acronym_style else casing
+
+# APIに問い合わせて (ケース指定なしの結果, {ケース: 結果}) を返す
+def record_case(api, text, token):
+    outputs = {}
+    translated_text = None
+    for casing, acronym_style in iter_styles(api):
+        req = api.build_api_request(api.Query(text, "", casing, acronym_style), token)
+        with urllib.request.urlopen(req, timeout=10) as response:
+            result, _ = api.parse_api_responses(response.read())[0]
+        outputs[style_name(casing, acronym_style)] = result.translated
+        if not casing:
+            translated_text = result.translated
+    return translated_text, outputs
+
+def check(api, fixtures):
+    failures = []
+    count = 0
+    for case in fixtures["cases"]:
+        source = api.Result(True, case["text"], case["translated_text"])
+        for casing, acronym_style in iter_styles(api):
+            name = style_name(casing, acronym_style)
+            expected = case["expected"].get(name)
+            actual = api.render_result(api.Query(case["text"], "", casing, acronym_style), source).translated
+            count += 1
+            if expected is None:
+                failures.append("{} [{}]: no expected value".format(case["text"], name))
+            elif actual != expected:
+                failures.append("{} [{}]: expected {!r}, got {!r}".format(case["text"], name, expected, actual))
+    return count, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the local casing against the Codic API outputs.")
+    parser.add_argument("--fixtures", default=FIXTURES_PATH)
+    parser.add_argument("--record", action="store_true", help="query Codic API and overwrite the expected values")
+    parser.add_argument("--token", default=os.environ.get("CODIC_ACCESS_TOKEN", ""), help="access token for --record")
+    args = parser.parse_args(argv)
+
+    run.load_plugin_class()
+    api = importlib.import_module("Codic.lib.api")
+    with open(args.fixtures, "r", encoding="utf-8") as file:
+        fixtures = json.load(file)
+
+    if args.record:
+        if not args.token:
+            parser.error("--record needs --token or CODIC_ACCESS_TOKEN")
+        for case in fixtures["cases"]:
+            case["translated_text"], case["expected"] = record_case(api, case["text"], args.token)
+        fixtures["source"] = "Codic API"
+        with open(args.fixtures, "w", encoding="utf-8") as file:
+            json.dump(fixtures, file, ensure_ascii=False, indent=2)
+            file.write("\n")
+        print("Recorded {} cases from Codic API.".format(len(fixtures["cases"])))
+
+    count, failures = check(api, fixtures)
+    for failure in failures:
+        print("FAIL " + failure)
+    print("{} of {} casing outputs match ({}).".format(count - len(failures), count, fixtures.get("source", "")))
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+レスポンスの読み込みのマイクロベンチマーク
+
+以前の読み込み方（文字列にデコードして .replace を2回してから json.loads）と
+lib.api の読み込みを、スタブサーバーの単語の一覧から生成した大きなレスポンスで比べる。
+結果が同じであることを確認してから、1回あたりの時間と結果が保持するメモリ量を表示する。
+
+    python bench/parse_bench.py --words 20 200 1000
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import run
+import stub_server
+
+# 以前の読み込み方（比較用）
+def legacy_loads(response):
+    response = response.decode(encoding="utf-8", errors="strict")
+    response = response.replace(",,", ",null,").replace("[,", "[null,")
+    return json.loads(response)
+
+def legacy_parse_api_responses(response, api):
+    results = []
+    for data in legacy_loads(response):
+        result = api.Result(data['successful'], data['text'], data['translated_text'])
+        words = []
+        for word in data['words']:
+            successful = word['successful']
+            text = word['text']
+            translated = word['translated_text'] if successful else text
+            candidates = [candidate['text'] for candidate in word['candidates']] if successful else [text]
+            if successful and translated is None:
+                pass
+            else:
+                words.append(api.Word(successful, text, translated, candidates))
+        results.append((result, words))
+    return results
+
+# 3件分の長い入力のレスポンスを作る（elided の場合は8語に1語の候補に省略された要素を入れる）
+def build_response(dictionary, word_count, elided, seed=0):
+    rng = random.Random(seed)
+    vocabulary = sorted(dictionary.words)
+    data = []
+    for _ in range(3):
+        text = "".join(rng.choice(vocabulary) for _ in range(word_count))
+        element = dictionary.translate(text)
+        if elided:
+            for word in element["words"][::8]:
+                if len(word["candidates"]) > 1:
+                    word["candidates"].insert(1, None)
+        data.append(element)
+    return stub_server.dumps_elided(data).encode("utf-8")
+
+# 比較できる形にそろえる
+def normalize(results):
+    return [
+        (tuple(result), [(s, t, tr, tuple(c)) for s, t, tr, c in words])
+        for result, words in results]
+
+# 交互に繰り返して最も速かった回を使う（他の処理の影響を減らす）
+def measure(legacy, current, body, number, repeat):
+    times = ([], [])
+    for _ in range(repeat):
+        for func, samples in zip((legacy, current), times):
+            samples.append(timeit.timeit(lambda: func(body), number=number) / number)
+    return min(times[0]), min(times[1])
+
+# 結果を持っている間のメモリ量
+def retained(func, body):
+    tracemalloc.start()
+    result = func(body)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the response parser with the previous one.")
+    parser.add_argument("--words", type=int, nargs="+", default=[20, 200, 1000], help="words per text")
+    parser.add_argument("--number", type=int, default=0, help="calls per measurement (default: auto)")
+    parser.add_argument("--repeat", type=int, default=15, help="measurements per case")
+    args = parser.parse_args(argv)
+
+    run.load_plugin_class()
+    api = importlib.import_module("Codic.lib.api")
+    dictionary = stub_server.Dictionary.load()
+
+    print("{:>6} {:<28} {:>8} {:>12} {:>12} {:>8}".format(
+        "words", "case", "bytes", "legacy", "current", "speedup"))
+    for word_count in args.words:
+        number = args.number if args.number else max(10, 20000 // word_count)
+        plain = build_response(dictionary, word_count, elided=False)
+        elided = build_response(dictionary, word_count, elided=True)
+
+        # 同じ結果になることを確認する
+        assert normalize(api.parse_api_responses(plain)) == normalize(legacy_parse_api_responses(plain, api))
+        assert api.loads_elided(elided) == legacy_loads(elided)
+        legacy_parse = lambda body: legacy_parse_api_responses(body, api)
+
+        cases = (
+            ("decode (no elision)", legacy_loads, api.loads_elided, plain),
+            ("decode (elided elements)", legacy_loads, api.loads_elided, elided),
+            ("parse (no elision)", legacy_parse, api.parse_api_responses, plain),
+        )
+        for name, legacy, current, body in cases:
+            legacy_time, current_time = measure(legacy, current, body, number, args.repeat)
+            print("{:>6} {:<28} {:>8} {:>9.1f}us {:>9.1f}us {:>7.2f}x".format(
+                word_count, name, len(body), legacy_time * 1e6, current_time * 1e6, legacy_time / current_time))
+        print("{:>6} {:<28} {:>8} {:>10}KB {:>10}KB".format(
+            word_count, "retained by parsed result", "",
+            retained(legacy_parse, plain) // 1024, retained(api.parse_api_responses, plain) // 1024))
+
+    # 以前の読み込み方では入力に含まれる ",," も置き換えてしまっていた
+    body = b'[{"successful":true,"text":"a,,b","translated_text":"a,,b","words":[]}]'
+    print("input with ',,': legacy {!r}, current {!r}".format(
+        legacy_loads(body)[0]["text"], api.loads_elided(body)[0]["text"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
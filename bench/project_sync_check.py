@@ -0,0 +1,143 @@
+"""
+プロジェクトの登録語の同期（ProjectMirror）をスタブサーバーで確認する
+
+stub_server.py の /v1/user_projects/{id}/entries.json（updated_since, offset, count）
+から登録語を取得し、以下を確認する。一致しないものがあれば終了コード1で終わる。
+
+* 初回は全ての登録語をページ毎に取得する
+* 2回目以降は前回の最新の更新日時より後に更新された登録語だけを取得する
+* 登録語は翻訳APIを呼ばずに翻訳され、再起動後も保存した内容から読み込まれる
+* 存在しないプロジェクトの同期は失敗しても他のプロジェクトの同期を止めない
+
+    python bench/project_sync_check.py
+"""
+
+import argparse
+import copy
+import shutil
+import sys
+import tempfile
+
+import run
+
+import stub_server
+
+PROJECT_ID = "42"
+MISSING_PROJECT_ID = "404"
+
+PROJECT_ITEMS = """
+[custom_item/project]
+item_label = Codic: project
+project_id = {}
+
+[custom_item/missing]
+item_label = Codic: missing project
+project_id = {}
+""".format(PROJECT_ID, MISSING_PROJECT_ID)
+
+class Checker:
+    """確認結果を記録する"""
+
+    def __init__(self):
+        self.count = 0
+        self.failures = []
+
+    def expect(self, name, actual, expected):
+        self.count += 1
+        if actual != expected:
+            self.failures.append("{}: expected {!r}, got {!r}".format(name, expected, actual))
+
+# 同期の予約を待たずに同期する（次回の予約は取り消す）
+def sync(driver):
+    driver.plugin._sync_projects()
+    if driver.plugin._project_sync_timer:
+        driver.plugin._project_sync_timer.cancel()
+
+def find_item(driver, project_id):
+    return next(item for item in driver.translate_items()
+                if driver.plugin._sections[item.target()].project_id == project_id)
+
+def translate(driver, text):
+    suggestion = driver.suggest(text, [find_item(driver, PROJECT_ID)])
+    return suggestion.items[0].label() if suggestion.items else None
+
+def create_driver(plugin_class, server, cache_dir, page_size):
+    settings_text = run.build_settings(["project_sync_interval = 60"]) + PROJECT_ITEMS
+    driver = run.Driver(plugin_class, server, settings_text, cache_dir)
+    sync_timer = driver.plugin._project_sync_timer
+    if sync_timer:
+        sync_timer.cancel()
+    driver.plugin._projects.PAGE_SIZE = page_size
+    return driver
+
+def check(plugin_class, page_size):
+    # count 件を取得する時のリクエスト数（存在しないプロジェクトへの1回を含む）
+    def requests(count):
+        return count // page_size + 1 + 1
+
+    checker = Checker()
+    dictionary = stub_server.Dictionary.load()
+    dictionary.projects = copy.deepcopy(dictionary.projects)
+    entries = dictionary.projects[PROJECT_ID]
+    server = stub_server.StubCodicServer(dictionary=dictionary).start()
+    cache_dir = tempfile.mkdtemp(prefix="codic-project-")
+    try:
+        # 初回は全件をページ毎に取得する
+        driver = create_driver(plugin_class, server, cache_dir, page_size)
+        server.reset_counts()
+        sync(driver)
+        checker.expect("first sync requests", server.counts["requests"], requests(len(entries)))
+        for entry in entries:
+            checker.expect("lookup " + entry["text"],
+                           driver.plugin._projects.lookup(PROJECT_ID, entry["text"]),
+                           (entry["translated_text"],))
+
+        # 登録語は翻訳APIを呼ばずに翻訳する
+        server.reset_counts()
+        checker.expect("translate " + entries[0]["text"], translate(driver, entries[0]["text"]),
+                       entries[0]["translated_text"])
+        checker.expect("translate requests", server.counts["texts"], 0)
+
+        # 前回以降に更新された登録語だけを取得する
+        entries.append({"id": 99, "text": "仕入先", "translated_text": "supplier",
+                        "updated_at": "2024-04-01T09:00:00+09:00"})
+        entries[0] = dict(entries[0], translated_text="customer book", updated_at="2024-04-02T09:00:00+09:00")
+        server.reset_counts()
+        sync(driver)
+        checker.expect("second sync requests", server.counts["requests"], requests(2))
+        checker.expect("updated entry", driver.plugin._projects.lookup(PROJECT_ID, entries[0]["text"]),
+                       ("customer book",))
+        checker.expect("added entry", driver.plugin._projects.lookup(PROJECT_ID, "仕入先"), ("supplier",))
+        checker.expect("translate updated entry", translate(driver, entries[0]["text"]), "customer book")
+
+        server.reset_counts()
+        sync(driver)
+        checker.expect("unchanged sync requests", server.counts["requests"], requests(0))
+        driver.deactivate()
+        driver.plugin._client.close()
+
+        # 再起動後は保存した登録語と更新日時を引き継ぐ
+        driver = create_driver(plugin_class, server, cache_dir, page_size)
+        checker.expect("reloaded entry", driver.plugin._projects.lookup(PROJECT_ID, "仕入先"), ("supplier",))
+        server.reset_counts()
+        sync(driver)
+        checker.expect("reloaded sync requests", server.counts["requests"], requests(0))
+        driver.plugin._client.close()
+    finally:
+        server.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return checker
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the project entry synchronization against the stub server.")
+    parser.add_argument("--page-size", type=int, default=2, help="entries per request (ProjectMirror.PAGE_SIZE)")
+    args = parser.parse_args(argv)
+
+    checker = check(run.load_plugin_class(), args.page_size)
+    for failure in checker.failures:
+        print("FAIL " + failure)
+    print("{} of {} project sync checks passed.".format(checker.count - len(checker.failures), checker.count))
+    return 1 if checker.failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""
+Keypirinha なしでプラグインの on_suggest を動かすベンチマーク
+
+shim/ の keypirinha モジュールの代替と stub_server.py のスタブサーバーを使い、
+以下のシナリオで入力から候補が表示されるまでの時間を計る。
+
+* typing: 1文字ずつ入力する（最後の入力から結果が出るまでの時間）
+* candidates: 翻訳後に単語の候補を順に選ぶ
+* switch: 同じ入力でケースの異なる項目を切り替える
+
+    python bench/run.py --scenario all --latency 0.1 --repeat 2
+"""
+
+import argparse
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+PHRASES_PATH = os.path.join(BENCH_DIR, "data", "phrases.txt")
+
+sys.path.insert(0, os.path.join(BENCH_DIR, "shim"))
+sys.path.insert(0, BENCH_DIR)
+
+import keypirinha as kp
+import stub_server
+
+SCENARIOS = ("typing", "candidates", "switch")
+
+# switch シナリオで切り替える項目
+CUSTOM_ITEMS = """
+[custom_item/pascal]
+item_label = Codic: PascalCase
+casing = pascal
+acronym_style = camel strict
+
+[custom_item/camel]
+item_label = Codic: camelCase
+casing = camel
+
+[custom_item/lower]
+item_label = Codic: snake_case
+casing = lower underscore
+
+[custom_item/upper]
+item_label = Codic: UPPER_CASE
+casing = upper underscore
+"""
+
+# src を Keypirinha と同じくパッケージとして読み込む（codic.py は相対インポートを使う）
+def load_plugin_class(package_name="Codic"):
+    if package_name not in sys.modules:
+        package = types.ModuleType(package_name)
+        package.__path__ = [SRC_DIR]
+        sys.modules[package_name] = package
+    return importlib.import_module(package_name + ".codic").Codic
+
+class Suggestion:
+    """1回の on_suggest の記録"""
+
+    def __init__(self, seq, text):
+        self.seq = seq
+        self.text = text
+        self.start = time.monotonic()
+        # (経過秒, 項目)
+        self.updates = []
+        self.end = None
+
+    @property
+    def first(self):
+        return self.updates[0][0] if self.updates else None
+
+    @property
+    def final(self):
+        return self.updates[-1][0] if self.updates else None
+
+    @property
+    def items(self):
+        return self.updates[-1][1] if self.updates else []
+
+class Driver:
+    """スタブサーバーに接続したプラグインに入力を送る"""
+
+    def __init__(self, plugin_class, server, settings_text, cache_dir):
+        self._suggestions = {}
+        self._lock = threading.Lock()
+
+        kp.runtime.settings_text = settings_text
+        kp.runtime.cache_dir = cache_dir
+        kp.runtime.on_suggestions = self._on_suggestions
+
+        self.plugin = plugin_class()
+        self.plugin.API_URL = server.base_url + stub_server.TRANSLATE_PATH
+        self.plugin.API_PROJECTS_URL = server.base_url + stub_server.PROJECTS_PATH
+        self.plugin.API_PROJECT_ENTRIES_URL = server.base_url + "/v1/user_projects/{}/entries.json"
+        self.plugin.on_start()
+        self.plugin.on_catalog()
+
+    def translate_items(self):
+        return [item for item in self.plugin.catalog() if item.category() == self.plugin.ITEMCAT_TRANSLATE]
+
+    # 入力を送って終わるまで待つ
+    def suggest(self, text, items_chain):
+        suggestion = self._begin(text)
+        self._run(suggestion, text, items_chain)
+        return suggestion
+
+    # 入力を送って終わるのを待たずに返す
+    def suggest_async(self, text, items_chain):
+        suggestion = self._begin(text)
+        thread = threading.Thread(target=self._run, args=(suggestion, text, items_chain), daemon=True)
+        thread.start()
+        return suggestion, thread
+
+    # 1文字ずつ interval 秒毎に入力する
+    def type(self, text, item, interval):
+        suggestions = []
+        threads = []
+        for i in range(1, len(text) + 1):
+            suggestion, thread = self.suggest_async(text[:i], [item])
+            suggestions.append(suggestion)
+            threads.append(thread)
+            if i < len(text):
+                time.sleep(interval)
+        for thread in threads:
+            thread.join()
+        return suggestions
+
+    def activate(self):
+        self.plugin.on_activated()
+
+    def deactivate(self):
+        self.plugin.on_deactivated()
+
+    def stats(self):
+        return self.plugin._stats.counters() if self.plugin._stats else {}
+
+    def _begin(self, text):
+        suggestion = Suggestion(kp.runtime.begin_suggest(), text)
+        with self._lock:
+            self._suggestions[suggestion.seq] = suggestion
+        return suggestion
+
+    def _run(self, suggestion, text, items_chain):
+        kp.runtime.bind(suggestion.seq)
+        try:
+            self.plugin.on_suggest(text, items_chain)
+        finally:
+            suggestion.end = time.monotonic() - suggestion.start
+            with self._lock:
+                self._suggestions.pop(suggestion.seq, None)
+
+    def _on_suggestions(self, seq, items):
+        with self._lock:
+            suggestion = self._suggestions.get(seq)
+        if suggestion:
+            suggestion.updates.append((time.monotonic() - suggestion.start, items))
+
+class Report:
+    """シナリオ毎の所要時間の集計"""
+
+    def __init__(self, name, stats_class):
+        self.name = name
+        self.count = 0
+        self.wall = 0.0
+        self.first = stats_class(window=1000000)
+        self.final = stats_class(window=1000000)
+        self.server = {}
+        self.plugin = {}
+
+    def add(self, suggestion):
+        self.count += 1
+        if suggestion.first is not None:
+            self.first.record("first", suggestion.first)
+        if suggestion.final is not None:
+            self.final.record("final", suggestion.final)
+
+    def to_dict(self):
+        data = {
+            "scenario": self.name,
+            "operations": self.count,
+            "wall_seconds": round(self.wall, 3),
+            "throughput": round(self.count / self.wall, 2) if self.wall else None,
+            "server": self.server,
+            "plugin": self.plugin
+        }
+        for stats, phase in ((self.first, "first"), (self.final, "final")):
+            total, values = stats.percentiles(phase)
+            data[phase] = {
+                "p{}".format(p): round(value * 1000, 2) if value is not None else None
+                for p, value in zip(stats.PERCENTILES, values)}
+        return data
+
+    def format(self):
+        data = self.to_dict()
+        lines = ["[{}] {} operations in {:.2f}s ({} ops/s)".format(
+            self.name, data["operations"], data["wall_seconds"], data["throughput"])]
+        for phase in ("first", "final"):
+            lines.append("  {:<6} {}".format(phase, " / ".join(
+                "{} {}ms".format(name, value) for name, value in data[phase].items())))
+        lines.append("  server " + ", ".join("{}={}".format(name, value) for name, value in sorted(self.server.items())))
+        lines.append("  plugin " + ", ".join("{}={}".format(name, value) for name, value in sorted(self.plugin.items())))
+        return "\n".join(lines)
+
+# 1文字ずつ入力し、最後の入力から結果が出るまでを計る
+def run_typing(driver, phrases, args, report):
+    item = driver.translate_items()[0]
+    for phrase in phrases:
+        driver.activate()
+        suggestions = driver.type(phrase, item, args.key_interval)
+        report.add(suggestions[-1])
+        driver.deactivate()
+
+# 翻訳した後、単語の候補を1つずつ選んでいく
+def run_candidates(driver, phrases, args, report):
+    item = driver.translate_items()[0]
+    for phrase in phrases:
+        driver.activate()
+        chain = [item]
+        suggestion = driver.suggest(phrase, chain)
+        report.add(suggestion)
+        while True:
+            candidates = [
+                candidate for candidate in suggestion.items
+                if candidate.category() == driver.plugin.ITEMCAT_CANDIDATE]
+            if not candidates:
+                break
+            # 2番目の候補があればそれを選ぶ（候補の並べ替えも通す）
+            chain = chain + [candidates[min(1, len(candidates) - 1)]]
+            suggestion = driver.suggest("", chain)
+            report.add(suggestion)
+        if len(chain) > 1:
+            driver.plugin.on_execute(chain[-1], None)
+        driver.deactivate()
+
+# 同じ入力でケースの異なる項目を順に使う
+def run_switch(driver, phrases, args, report):
+    items = driver.translate_items()
+    for phrase in phrases:
+        driver.activate()
+        for item in items:
+            report.add(driver.suggest(phrase, [item]))
+        driver.deactivate()
+
+RUNNERS = {
+    "typing": run_typing,
+    "candidates": run_candidates,
+    "switch": run_switch
+}
+
+def build_settings(overrides):
+    lines = ["[defaults]", "access_token = bench"]
+    for override in overrides:
+        key, _, value = override.partition("=")
+        lines.append("{} = {}".format(key.strip(), value.strip()))
+    return "\n".join(lines) + "\n" + CUSTOM_ITEMS
+
+def load_phrases(path, limit):
+    with open(path, "r", encoding="utf-8") as file:
+        phrases = [line.strip() for line in file if line.strip()]
+    return phrases[:limit] if limit else phrases
+
+def run_scenario(name, plugin_class, stats_class, args):
+    faults = stub_server.Faults(args.latency, args.jitter, args.error_rate, args.error_status,
+                                args.drop_rate, args.rate_limit, args.seed)
+    server = stub_server.StubCodicServer(faults=faults).start()
+    cache_dir = tempfile.mkdtemp(prefix="codic-bench-")
+    report = Report(name, stats_class)
+    try:
+        driver = Driver(plugin_class, server, build_settings(args.set), cache_dir)
+        phrases = load_phrases(args.phrases, args.limit)
+        start = time.monotonic()
+        for _ in range(args.repeat):
+            RUNNERS[name](driver, phrases, args, report)
+        report.wall = time.monotonic() - start
+        report.server = dict(server.counts)
+        report.plugin = driver.stats()
+        driver.plugin._client.close()
+    finally:
+        server.stop()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Codic plugin against a stub Codic API.")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--phrases", default=PHRASES_PATH, help="one input per line")
+    parser.add_argument("--limit", type=int, default=0, help="use only the first N phrases")
+    parser.add_argument("--repeat", type=int, default=1, help="run the phrases N times (later runs hit the cache)")
+    parser.add_argument("--key-interval", type=float, default=0.08, help="seconds between keystrokes (typing)")
+    parser.add_argument("--latency", type=float, default=0.05, help="stub server delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="plugin setting in the [defaults] section, e.g. --set local_casing=yes")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    plugin_class = load_plugin_class()
+    stats_class = importlib.import_module("Codic.lib.stats").Stats
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    reports = [run_scenario(name, plugin_class, stats_class, args) for name in scenarios]
+    if args.json:
+        print(json.dumps([report.to_dict() for report in reports], indent=2))
+    else:
+        for report in reports:
+            print(report.format())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
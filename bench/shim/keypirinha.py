@@ -0,0 +1,265 @@
+"""
+ベンチマーク用の keypirinha モジュールの代替
+
+プラグインが使う範囲だけを実装する。設定は runtime.settings_text に書いた
+ini 形式の文字列から読み込み、should_terminate は同じ runtime で新しい
+on_suggest が始まった時点で True を返す（Keypirinha と同じ振る舞い）。
+set_suggestions は runtime.on_suggestions に呼び出し元の入力番号と共に通知する。
+"""
+
+import configparser
+import os
+import tempfile
+import threading
+import time
+
+class ItemCategory:
+    KEYWORD = 1
+    USER_BASE = 1000
+
+class Match:
+    ANY = 0
+    FUZZY = 1
+    DEFAULT = 2
+
+class Sort:
+    NONE = 0
+    SCORE_DESC = 1
+    DEFAULT = 2
+
+class ItemArgsHint:
+    FORBIDDEN = 0
+    ACCEPTED = 1
+    REQUIRED = 2
+
+class ItemHitHint:
+    IGNORE = 0
+    NOARGS = 1
+    KEEPALL = 2
+
+class Events:
+    APPCONFIG = 1
+    PACKCONFIG = 2
+    NETOPTIONS = 4
+    DESKTOP = 8
+
+class CatalogItem:
+    def __init__(self, category=0, label="", short_desc="", target="", args_hint=0, hit_hint=0, **kwargs):
+        self._category = category
+        self._label = label
+        self._short_desc = short_desc
+        self._target = target
+        self._args_hint = args_hint
+        self._hit_hint = hit_hint
+        self._data_bag = None
+
+    def category(self):
+        return self._category
+
+    def label(self):
+        return self._label
+
+    def short_desc(self):
+        return self._short_desc
+
+    def target(self):
+        return self._target
+
+    def args_hint(self):
+        return self._args_hint
+
+    def hit_hint(self):
+        return self._hit_hint
+
+    def data_bag(self):
+        return self._data_bag
+
+    def set_data_bag(self, data_bag):
+        self._data_bag = data_bag
+
+    def __repr__(self):
+        return "CatalogItem({!r}, {!r})".format(self._label, self._short_desc)
+
+class CatalogAction:
+    def __init__(self, name="", label="", short_desc="", **kwargs):
+        self._name = name
+        self._label = label
+        self._short_desc = short_desc
+
+    def name(self):
+        return self._name
+
+    def label(self):
+        return self._label
+
+class Settings:
+    """Keypirinha の設定オブジェクトと同じ読み方をする ini のラッパー"""
+
+    TRUE_VALUES = {"1", "yes", "y", "true", "on"}
+    FALSE_VALUES = {"0", "no", "n", "false", "off"}
+
+    def __init__(self, text):
+        self._parser = configparser.ConfigParser(interpolation=None)
+        self._parser.optionxform = str
+        self._parser.read_string(text)
+
+    def sections(self):
+        return self._parser.sections()
+
+    def get(self, key, section=None, fallback=None, unquote=True):
+        if not self._parser.has_option(section, key):
+            return fallback
+        return self._parser.get(section, key)
+
+    def get_stripped(self, key, section=None, fallback=None, unquote=True):
+        value = self.get(key, section, None)
+        if value is None:
+            return fallback
+        value = value.strip()
+        return value if value else fallback
+
+    def get_bool(self, key, section=None, fallback=None):
+        value = self.get_stripped(key, section, None)
+        if value is None:
+            return fallback
+        value = value.lower()
+        if value in self.TRUE_VALUES:
+            return True
+        if value in self.FALSE_VALUES:
+            return False
+        return fallback
+
+    def get_int(self, key, section=None, fallback=None, min=None, max=None):
+        return self._get_number(int, key, section, fallback, min, max)
+
+    def get_float(self, key, section=None, fallback=None, min=None, max=None):
+        return self._get_number(float, key, section, fallback, min, max)
+
+    def get_enum(self, key, section=None, fallback=None, enum=()):
+        value = self.get_stripped(key, section, None)
+        return value if value in enum else fallback
+
+    def _get_number(self, cast, key, section, fallback, min, max):
+        value = self.get_stripped(key, section, None)
+        if value is None:
+            return fallback
+        try:
+            value = cast(value)
+        except ValueError:
+            return fallback
+        if (min is not None and value < min) or (max is not None and value > max):
+            return fallback
+        return value
+
+class Runtime:
+    """
+    Keypirinha 本体の代わりに on_suggest の入力番号と設定を管理する
+
+    begin_suggest() で新しい入力を始めると、それより前の入力のスレッドの
+    should_terminate() は待ち時間の途中でも True を返す。
+    """
+
+    def __init__(self):
+        self.settings_text = "[defaults]\n"
+        self.cache_dir = None
+        # set_suggestions の通知先 on_suggestions(seq, suggestions)
+        self.on_suggestions = None
+        # 出力するログの種類（"dbg", "info", "warn", "err"）
+        self.log_levels = {"warn", "err"}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+    # 新しい入力を始めて番号を返す
+    def begin_suggest(self):
+        with self._cond:
+            self._seq += 1
+            self._cond.notify_all()
+            return self._seq
+
+    # 現在のスレッドの入力番号を設定する
+    def bind(self, seq):
+        self._local.seq = seq
+
+    def current(self):
+        return getattr(self._local, "seq", None)
+
+    def should_terminate(self, wait):
+        deadline = time.monotonic() + (wait or 0)
+        seq = self.current()
+        with self._cond:
+            while True:
+                if seq is not None and seq != self._seq:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+    def get_cache_dir(self):
+        if not self.cache_dir:
+            self.cache_dir = tempfile.mkdtemp(prefix="codic-bench-")
+        return self.cache_dir
+
+runtime = Runtime()
+
+class Plugin:
+    def __init__(self):
+        self._catalog = []
+        self._actions = {}
+
+    def dbg(self, *args):
+        self._log("dbg", args)
+
+    def info(self, *args):
+        self._log("info", args)
+
+    def warn(self, *args):
+        self._log("warn", args)
+
+    def err(self, *args):
+        self._log("err", args)
+
+    def log(self, *args):
+        self._log("info", args)
+
+    def create_item(self, **kwargs):
+        return CatalogItem(**kwargs)
+
+    def create_error_item(self, **kwargs):
+        return CatalogItem(category=-1, **kwargs)
+
+    def create_action(self, **kwargs):
+        return CatalogAction(**kwargs)
+
+    def set_actions(self, category, actions):
+        self._actions[category] = list(actions)
+
+    def set_catalog(self, catalog):
+        self._catalog = list(catalog)
+
+    def catalog(self):
+        return list(self._catalog)
+
+    def set_suggestions(self, suggestions, match_method=Match.DEFAULT, sort_method=Sort.DEFAULT):
+        if runtime.on_suggestions:
+            runtime.on_suggestions(runtime.current(), list(suggestions))
+
+    def load_settings(self):
+        return Settings(runtime.settings_text)
+
+    def load_text_resource(self, name):
+        raise FileNotFoundError(name)
+
+    def should_terminate(self, wait=0.0):
+        return runtime.should_terminate(wait)
+
+    def get_package_cache_path(self, create=False):
+        path = runtime.get_cache_dir()
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def _log(self, level, args):
+        if level in runtime.log_levels:
+            print("[{}] {}".format(level, " ".join(str(arg) for arg in args)))
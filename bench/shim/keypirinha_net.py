@@ -0,0 +1,13 @@
+"""
+ベンチマーク用の keypirinha_net モジュールの代替
+
+ベンチマークはローカルのスタブサーバーに接続するためプロキシは使わない。
+"""
+
+import urllib.request
+
+def get_proxies(force_proxy_url=None):
+    return {}
+
+def build_urllib_opener(proxies=None, ssl_check_hostname=None, extra_handlers=[]):
+    return urllib.request.build_opener()
@@ -0,0 +1,14 @@
+"""
+ベンチマーク用の keypirinha_util モジュールの代替
+
+クリップボードとブラウザの操作は記録するだけで何もしない。
+"""
+
+clipboard = []
+browsed = []
+
+def set_clipboard(text):
+    clipboard.append(text)
+
+def web_browser_command(private_mode=None, new_window=None, url=None, execute=True):
+    browsed.append(url)
@@ -0,0 +1,298 @@
+"""
+ベンチマーク用の Codic API スタブサーバー
+
+data/codic_words.json の "words" の単語の最長一致で Codic と同じ形式のレスポンスを組み立てる。
+実際の Codic API のレスポンスを記録したものではなく、全て単語の一覧から生成する。
+Codic と同じく配列の null 要素は省略して返す（"[,"、",,"）。
+遅延、エラー、接続の切断、回数制限を設定して注入できる。
+
+    python bench/stub_server.py --port 8080 --latency 0.1 --error-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "codic_words.json")
+
+TRANSLATE_PATH = "/v1/engine/translate.json"
+PROJECTS_PATH = "/v1/user_projects.json"
+PROJECT_ENTRIES_PATTERN = re.compile(r"^/v1/user_projects/([^/]+)/entries\.json$")
+
+class Dictionary:
+    """単語の一覧から翻訳結果を作る"""
+
+    def __init__(self, data):
+        self.words = data.get("words", {})
+        self.projects = data.get("projects", {})
+        self._max_length = max((len(word) for word in self.words), default=1)
+
+    @classmethod
+    def load(cls, path=DATA_PATH):
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(json.load(file))
+
+    def translate(self, text, casing=None, acronym_style=None):
+        words = []
+        translated = []
+        successful = True
+        for segment in self._segment(text):
+            candidates = self.words.get(segment)
+            if candidates is None:
+                successful = False
+                words.append({"successful": False, "text": segment, "translated_text": None, "candidates": []})
+                translated.append(segment)
+            elif not candidates:
+                # を、は等は訳語がない
+                words.append({"successful": True, "text": segment, "translated_text": None, "candidates": []})
+            else:
+                words.append({
+                    "successful": True,
+                    "text": segment,
+                    "translated_text": candidates[0],
+                    "candidates": [{"text": candidate} for candidate in candidates]})
+                translated.append(candidates[0])
+
+        return {
+            "successful": successful,
+            "text": text,
+            "translated_text": apply_casing(translated, casing, acronym_style),
+            "words": words}
+
+    # 最長一致で単語に分ける（辞書にない部分は次に一致する位置までを1語とする）
+    def _segment(self, text):
+        segments = []
+        unknown = ""
+        i = 0
+        while i < len(text):
+            for j in range(min(len(text), i + self._max_length), i, -1):
+                if text[i:j] in self.words:
+                    if unknown:
+                        segments.append(unknown)
+                        unknown = ""
+                    segments.append(text[i:j])
+                    i = j
+                    break
+            else:
+                unknown += text[i]
+                i += 1
+        if unknown:
+            segments.append(unknown)
+        return segments
+
+# Codic のケース変換（スタブ用の簡易版）
+def apply_casing(words, casing, acronym_style):
+    parts = [part for word in words for part in word.split(" ") if part]
+    if casing in ("camel", "pascal"):
+        result = []
+        for part in parts:
+            if part.isupper() and acronym_style != "camel strict":
+                if acronym_style == "MS naming guidelines" and len(part) > 2:
+                    part = part.capitalize()
+            elif part != part.lower() and acronym_style not in ("MS naming guidelines", "camel strict"):
+                # literal は大文字を含む登録語をそのまま使う
+                pass
+            else:
+                part = part.capitalize()
+            result.append(part)
+        if casing == "camel" and result:
+            result[0] = result[0].lower()
+        return "".join(result)
+    if casing == "lower underscore":
+        return "_".join(part.lower() for part in parts)
+    if casing == "upper underscore":
+        return "_".join(part.upper() for part in parts)
+    if casing == "hyphen":
+        return "-".join(part.lower() for part in parts)
+    return " ".join(parts)
+
+# 配列の null 要素を省略して JSON にする（末尾以外）
+def dumps_elided(value):
+    if isinstance(value, list):
+        return "[" + ",".join(
+            "" if item is None and i < len(value) - 1 else dumps_elided(item)
+            for i, item in enumerate(value)) + "]" if value else "[]"
+    if isinstance(value, dict):
+        return "{" + ",".join(
+            json.dumps(key, ensure_ascii=False) + ":" + dumps_elided(item) for key, item in value.items()) + "}"
+    return json.dumps(value, ensure_ascii=False)
+
+class Faults:
+    """
+    注入する遅延と障害の設定
+
+    latency 秒に 0〜jitter 秒を加えて応答し、error_rate の割合で error_status を、
+    drop_rate の割合で応答せずに接続を切る。rate_limit 件を超えると429を返す（0は無制限）。
+    乱数は seed で固定するため、同じ順の問い合わせには同じ障害が起きる。
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 drop_rate=0.0, rate_limit=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_rate = drop_rate
+        self.rate_limit = rate_limit
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # (遅延秒, 障害の種類) を決める（"error", "drop" または None）
+    def draw(self):
+        with self._lock:
+            delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0)
+            roll = self._random.random()
+        if roll < self.drop_rate:
+            return delay, "drop"
+        if roll < self.drop_rate + self.error_rate:
+            return delay, "error"
+        return delay, None
+
+class StubCodicServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), dictionary=None, faults=None):
+        super().__init__(address, _Handler)
+        self.dictionary = dictionary if dictionary else Dictionary.load()
+        self.faults = faults if faults else Faults()
+        self.counts = {"requests": 0, "texts": 0, "errors": 0, "drops": 0, "limited": 0, "connections": 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return "http://{}:{}".format(*self.server_address[:2])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counts[name] += value
+            return self.counts[name]
+
+    def reset_counts(self):
+        with self._lock:
+            for name in self.counts:
+                self.counts[name] = 0
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        self._handle(url.path, dict(urllib.parse.parse_qsl(url.query)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        if "json" in self.headers.get("Content-Type", ""):
+            params = json.loads(body.decode("utf-8")) if body else {}
+        else:
+            params = dict(urllib.parse.parse_qsl(body.decode("utf-8")))
+        self._handle(urllib.parse.urlsplit(self.path).path, params)
+
+    def _handle(self, path, params):
+        server = self.server
+        used = server.count("requests")
+        delay, fault = server.faults.draw()
+        if delay:
+            time.sleep(delay)
+
+        if fault == "drop":
+            server.count("drops")
+            self.close_connection = True
+            self.connection.close()
+            return
+        if fault == "error":
+            server.count("errors")
+            self._send(server.faults.error_status, {"errors": [{"code": 0, "message": "injected error"}]})
+            return
+
+        limit = server.faults.rate_limit
+        headers = {}
+        if limit:
+            if used > limit:
+                server.count("limited")
+                self._send(429, {"errors": [{"code": 429, "message": "rate limit"}]}, {"Retry-After": "60"})
+                return
+            headers = {"X-RateLimit-Limit": str(limit), "X-RateLimit-Remaining": str(limit - used)}
+
+        if path == TRANSLATE_PATH:
+            texts = str(params.get("text", "")).split("\n")[:3]
+            server.count("texts", len(texts))
+            data = [server.dictionary.translate(
+                text, params.get("casing"), params.get("acronym_style")) for text in texts]
+            self._send(200, data, headers)
+        elif path == PROJECTS_PATH:
+            self._send(200, [{"id": int(project_id) if project_id.isdigit() else project_id, "name": project_id}
+                             for project_id in server.dictionary.projects], headers)
+        elif PROJECT_ENTRIES_PATTERN.match(path):
+            project_id = PROJECT_ENTRIES_PATTERN.match(path).group(1)
+            entries = server.dictionary.projects.get(project_id)
+            if entries is None:
+                self._send(404, {"errors": [{"code": 404, "message": "project not found"}]})
+                return
+            since = params.get("updated_since")
+            entries = [entry for entry in entries if not since or entry["updated_at"] > since]
+            offset = int(params.get("offset", 0))
+            count = int(params.get("count", 100))
+            self._send(200, entries[offset:offset + count], headers)
+        else:
+            self._send(404, {"errors": [{"code": 404, "message": "not found"}]})
+
+    def _send(self, status, data, headers=None):
+        body = dumps_elided(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Codic API server for benchmarks.")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--data", default=DATA_PATH, help="words and project entries (JSON)")
+    parser.add_argument("--latency", type=float, default=0.05, help="response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="ratio of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="ratio of connections closed without response")
+    parser.add_argument("--rate-limit", type=int, default=0, help="requests before 429 (0: unlimited)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.error_status,
+                    args.drop_rate, args.rate_limit, args.seed)
+    server = StubCodicServer(("127.0.0.1", args.port), Dictionary.load(args.data), faults)
+    print("Stub Codic API listening on {}".format(server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
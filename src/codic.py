@@ -4,11 +4,32 @@ import keypirinha as kp
 import keypirinha_util as kpu
 import keypirinha_net as kpnet
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import json
+import math
+import os
+import threading
+import time
 import traceback
 import urllib.error
 import urllib.parse
 import urllib.request
+from .lib import api
+from .lib.batch import RequestBatcher
+from .lib.cache import TranslationCache
+from .lib.canonical import canonicalize
+from .lib.client import KeepAliveClient
+from .lib.debounce import AdaptiveDebouncer
+from .lib.history import History
+from .lib.kbest import iter_best
+from .lib.lexicon import Lexicon
+from .lib.prefetch import Prefetcher
+from .lib.projects import ProjectMirror
+from .lib.ratelimit import RateLimiter, RateLimitExceeded
+from .lib.resilience import CircuitBreaker, ServiceUnavailable, hedged_call
+from .lib.singleflight import SingleFlight
+from .lib.stats import Stats
 
 class Codic(kp.Plugin):
     """
@@ -41,29 +62,26 @@ class Codic(kp.Plugin):
     _debug = False
 
     # 項目の設定
-    Section = namedtuple('Section', ('enabled', 'item_label', 'project_id', 'casing', 'acronym_style'))
+    Section = namedtuple('Section', ('enabled', 'item_label', 'project_id', 'casing', 'acronym_style', 'preview'))
+    # 項目の表示形式（プロジェクトとケース毎に一度だけ作り、変更しない）
+    # desc, bag は項目の説明とデータの先頭部分、combine は候補を結合する関数
+    Profile = namedtuple('Profile', ('desc', 'bag', 'combine'))
     # クエリ
-    Query = namedtuple('Query', ('text', 'project_id', 'casing', 'acronym_style'))
+    Query = api.Query
     # 結果（第一候補の結果）
-    Result = namedtuple('Result', ('successful', 'text', 'translated'))
+    Result = api.Result
     # 単語別の候補
-    Word = namedtuple('Word', ('successful', 'text', 'translated', 'candidates'))
-
-    API_URL = "https://api.codic.jp/v1/engine/translate.json"
-    BROWSE_URL = "https://codic.jp/engine?"
-
-    API_CASING_DICT = {
-        "camel": "camel",
-        "pascal": "pascal",
-        "lower underscore": "lower underscore",
-        "upper underscore": "upper underscore",
-        "hyphen": "hyphen"
-    }
-    API_ACRONYM_STYLE_DICT = {
-        "ms naming guidelines": "MS naming guidelines",
-        "camel strict": "camel strict",
-        "literal": "literal"
-    }
+    Word = api.Word
+    # 表示中の状態（クエリと結果の組、差し替えのみで変更はしない）
+    Snapshot = namedtuple('Snapshot', ('generation', 'query', 'result', 'words'))
+
+    API_URL = api.API_URL
+    API_PROJECTS_URL = "https://api.codic.jp/v1/user_projects.json"
+    API_PROJECT_ENTRIES_URL = "https://api.codic.jp/v1/user_projects/{}/entries.json"
+    BROWSE_URL = api.BROWSE_URL
+
+    API_CASING_DICT = api.CASING_DICT
+    API_ACRONYM_STYLE_DICT = api.ACRONYM_STYLE_DICT
 
     # 翻訳表示カテゴリ：翻訳結果項目
     ITEMCAT_TRANSLATE = kp.ItemCategory.USER_BASE + 1
@@ -71,6 +89,8 @@ class Codic(kp.Plugin):
     ITEMCAT_RESULT = kp.ItemCategory.USER_BASE + 2
     # 候補選択カテゴリ：訳語候補項目
     ITEMCAT_CANDIDATE = kp.ItemCategory.USER_BASE + 3
+    # 統計カテゴリ：処理時間の統計項目
+    ITEMCAT_STATS = kp.ItemCategory.USER_BASE + 4
 
     CONFIG_SECTION_DEFAULTS = "defaults"
     CONFIG_SECTION_CUSTOM_ITEM = "custom_item"
@@ -80,27 +100,144 @@ class Codic(kp.Plugin):
     ACTION_BROWSE_PRIVATE = "browse_private"
     ACTION_COPY_URL = "copy_url"
 
-    DEFAULT_SECTION = Section(True, "Codic:", "", "", "")
+    DEFAULT_SECTION = Section(True, "Codic:", "", "", "", False)
     DEFAULT_IDLE_TIME = 0.3
+    ADAPTIVE_IDLE_TIME = True
+    MIN_IDLE_TIME = 0.1
+    MAX_IDLE_TIME = 3
+    DEFAULT_CACHE_SIZE = 1000
+    DEFAULT_CACHE_TTL = 30
+    DEFAULT_RATE_LIMIT = 2500
+    REQUEST_TIMEOUT = 5
+    HEDGE_DELAY = 1
+    FAILURE_THRESHOLD = 3
+    UNAVAILABLE_COOLDOWN = 30
+    LOCAL_CASING = False
+    CANONICALIZE_QUERY = True
+    TWO_PHASE = True
+    OFFLINE_FAST_PATH = False
+    ALTERNATIVE_COUNT = 5
+    HISTORY_COUNT = 3
+    # 履歴の回数を候補の順位に反映する重み
+    HISTORY_WEIGHT = 2.0
+    PROJECT_SYNC_INTERVAL = 0
+    PROJECT_SYNC_DELAY = 10
+    PRECONNECT = True
+    PRECONNECT_COOLDOWN = 60
+    VALIDATE_TOKEN = False
+    # 先読みする件数（0で無効）と、使ってよい回数制限の割合
+    PREFETCH_COUNT = 0
+    PREFETCH_SHARE = 0.1
+    PREFETCH_WORKERS = 1
+    STATS_ITEM = False
+    STATS_LOG_INTERVAL = 0
+    STATS_ITEM_LABEL = "Codic: stats"
+    # 統計に表示する段階（処理の順）
+    STATS_PHASES = ("idle", "connect", "server", "request", "parse", "items", "total")
     ACCESS_TOKEN = ''
 
+    CACHE_FILE_NAME = "translate_cache.json"
+    RATE_LIMIT_FILE_NAME = "rate_limit.json"
+    PREFETCH_RATE_LIMIT_FILE_NAME = "prefetch_rate_limit.json"
+    LEXICON_FILE_NAME = "lexicon.json"
+    HISTORY_FILE_NAME = "history.json"
+
     # 現在の状態保持用（Section以外は非表示になった時に初期化される）
-    _sections = []
-    _query = None
-    _result = None
-    _words = []
+    # 項目の設定（カタログ項目の target をキーにし、カタログの順に並べる）
+    _sections = {}
+    # 作成済みのカタログ項目（target をキーにする）
+    _catalog_items = {}
+    _stats_item = None
+    # 作成済みの表示形式（(project_id, casing, acronym_style) をキーにする）
+    _profiles = {}
+    _snapshot = None
+    _generation = 0
+    _generation_lock = None
+    _cache = None
+    _client = None
+    _batcher = None
+    _single_flight = None
+    _prefetcher = None
+    _prefetch_batcher = None
+    _debouncer = None
+    _limiter = None
+    # 先読み用の回数制限（回数制限の PREFETCH_SHARE の分）
+    _prefetch_limiter = None
+    _lexicon = None
+    _history = None
+    _candidate_choices = ()
+    _projects = None
+    _project_sync_timer = None
+    _breaker = None
+    # 入力中の問い合わせ用と、裏で行う問い合わせ（先読み、プロジェクトの同期）用
+    _executor = None
+    _background_executor = None
+    _preconnect_thread = None
+    _preconnect_time = 0
+    _token_error = None
+    _stats = None
+    _stats_timer = None
 
     def __init__(self):
         super().__init__()
 
     # 初期化時
     def on_start(self):
-        self._sections = []
-        self._query = None
-        self._result = None
-        self._words = []
+        self._sections = {}
+        self._catalog_items = {}
+        self._stats_item = None
+        self._profiles = {}
+        self._snapshot = None
+        self._generation = 0
+        self._generation_lock = threading.Lock()
+
+        self._cache = TranslationCache(
+            os.path.join(self.get_package_cache_path(True), self.CACHE_FILE_NAME),
+            encode=self._encode_cache_value,
+            decode=self._decode_cache_value)
+        self._limiter = RateLimiter(
+            os.path.join(self.get_package_cache_path(True), self.RATE_LIMIT_FILE_NAME))
+        self._prefetch_limiter = RateLimiter(
+            os.path.join(self.get_package_cache_path(True), self.PREFETCH_RATE_LIMIT_FILE_NAME))
+        self._lexicon = Lexicon(
+            os.path.join(self.get_package_cache_path(True), self.LEXICON_FILE_NAME))
+        self._history = History(
+            os.path.join(self.get_package_cache_path(True), self.HISTORY_FILE_NAME))
+        self._projects = ProjectMirror(self.get_package_cache_path(True), self._fetch_project_entries)
+        self._breaker = CircuitBreaker(self.FAILURE_THRESHOLD, self.UNAVAILABLE_COOLDOWN)
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="codic")
+        self._background_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="codic-background")
+
+        self._batcher = RequestBatcher(self._send_batch)
+        self._single_flight = SingleFlight()
+        self._prefetch_batcher = RequestBatcher(self._send_prefetch_batch)
+        self._prefetcher = Prefetcher(self._prefetch, self.PREFETCH_WORKERS)
+        self._debouncer = AdaptiveDebouncer(self.MIN_IDLE_TIME, self.MAX_IDLE_TIME)
+        self._stats = Stats()
 
         self._read_config()
+        self._build_client()
+
+        try:
+            self._cache.load()
+        except Exception as exc:
+            self.warn("Failed to load translation cache. Error: {}".format(exc))
+        try:
+            self._limiter.load()
+            self._prefetch_limiter.load()
+        except Exception as exc:
+            self.warn("Failed to load request limit state. Error: {}".format(exc))
+        try:
+            self._lexicon.load()
+            # 辞書ができる前のキャッシュからも学習する
+            for key, (_, words) in self._cache.items():
+                self._learn_words(key[0], words)
+        except Exception as exc:
+            self.warn("Failed to load lexicon. Error: {}".format(exc))
+        try:
+            self._history.load()
+        except Exception as exc:
+            self.warn("Failed to load history. Error: {}".format(exc))
 
         # アクションを追加
         actions = [
@@ -125,10 +262,8 @@ class Codic(kp.Plugin):
 
     # カタログが生成された時
     def on_catalog(self):
-        # 項目をカタログに追加する
-        catalog = self._read_config()
-        if catalog:
-            self.set_catalog(catalog)
+        # 項目をカタログに追加する（設定は on_start, on_events で読み込み済み）
+        self.set_catalog(self._build_catalog())
 
     # キー入力時
     def on_suggest(self, user_input, items_chain):
@@ -137,9 +272,25 @@ class Codic(kp.Plugin):
 
         current_item = items_chain[-1]
 
-        # アクセストークンがない場合はエラー
+        # 統計は通信しないのでトークンに関係なく表示する
+        if current_item.category() == self.ITEMCAT_STATS:
+            self._on_suggest_stats(user_input, items_chain, current_item)
+            return
+
+        # アクセストークンがない場合はエラー（翻訳はキャッシュと学習済みの単語だけで行う）
+        token_error = None
         if not self.ACCESS_TOKEN or self.ACCESS_TOKEN == "YOUR_ACCESS_TOKEN":
-            self._on_suggest_error(user_input, "Access token is not defined! See codic configuration.")
+            token_error = "Access token is not defined! See codic configuration."
+        elif self._token_error:
+            token_error = self._token_error
+
+        if token_error:
+            if current_item.category() == self.ITEMCAT_TRANSLATE and len(self._lexicon):
+                self._on_suggest_translate(user_input, items_chain, current_item, token_error)
+            elif current_item.category() == self.ITEMCAT_CANDIDATE:
+                self._on_suggest_candidate(user_input, items_chain, current_item)
+            else:
+                self._on_suggest_error(user_input, token_error)
         else:
             if current_item.category() == self.ITEMCAT_TRANSLATE:
                 self._on_suggest_translate(user_input, items_chain, current_item)
@@ -154,45 +305,168 @@ class Codic(kp.Plugin):
         if suggestions:
             self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
 
-    def _on_suggest_translate(self, user_input, items_chain, current_item):
+    def _on_suggest_translate(self, user_input, items_chain, current_item, offline_reason=None):
         suggestions = []
+        start = time.monotonic()
+
+        generation = self._next_generation()
+        self._debouncer.record_input()
+        query = self._extract_search_query(current_item, user_input)
+        preview = self._is_preview(current_item)
+        self._candidate_choices = ()
+        self.dbg(generation, query)
+
+        # 複数行の場合はまとめて翻訳する
+        if len(query.text.splitlines()) > 1 and not offline_reason:
+            self._on_suggest_translate_lines(user_input, generation, query)
+            return
 
-        self._query = self._extract_search_query(current_item, user_input)
-        self.dbg(self._query)
+        if len(query.text):
+            # ケースをローカルで変換する場合はケース指定なしで取得する
+            fetch_query = self._create_fetch_query(query, preview)
+            source = None
+
+            # キャッシュにあれば通信せずに表示する
+            cache_key = self._create_cache_key(fetch_query)
+            cached = self._cache.get(cache_key)
+            self._stats.increment("cache_hit" if cached is not None else "cache_miss")
+            if cached is not None and self._prefetcher.consume(cache_key):
+                self._stats.increment("prefetch_hit")
+
+            # プロジェクトの登録語はローカルのコピーから引く
+            if cached is None and fetch_query.project_id:
+                project = self._translate_project(fetch_query)
+                if project:
+                    cached, source = project, "project"
+                    self._stats.increment("project_hit")
+
+            # 学習済みの単語だけで翻訳できる場合も通信しない
+            if cached is None and self.OFFLINE_FAST_PATH:
+                offline = self._translate_offline(fetch_query.text)
+                if offline and offline[0].successful:
+                    cached, source = offline, "offline"
+                    self._stats.increment("offline_hit")
+
+            # 1段階目：通信を待たずにローカルで分かるものを先に表示する
+            local_items = []
+            if cached is None and self.TWO_PHASE:
+                local_items = self._create_local_items(query)
+                empty_snapshot = self.Snapshot(generation, query, self.Result(False, '', ''), ())
+                if local_items and self._publish_snapshot(empty_snapshot):
+                    self.set_suggestions(local_items, kp.Match.ANY, kp.Sort.NONE)
+
+            if cached is None and not offline_reason:
+                with self._stats.timer("idle"):
+                    terminated = self.should_terminate(self._get_idle_time(query))
+                if terminated:
+                    self._stats.increment("cancelled")
+                    return
+                # 入力が止まった時だけ、結果を待つ間に次に入力されそうなものを翻訳しておく
+                self._start_prefetch(query, fetch_query)
 
-        if len(self._query.text):
-            if self.should_terminate(self.DEFAULT_IDLE_TIME):
+            # 2段階目：APIの結果で置き換える
+            result = self.Result(False, '', '')
+            words = ()
+            succeeded = False
+
+            try:
+                if cached is not None:
+                    result, words = cached
+                elif offline_reason:
+                    raise PermissionError(offline_reason)
+                else:
+                    (result, words), shared = self._fetch_translation(fetch_query)
+                    if shared:
+                        self._stats.increment("coalesced")
+                        self.dbg("Shared in-flight request:", fetch_query)
+                    if self.should_terminate():
+                        self._stats.increment("cancelled")
+                        return
+                succeeded = True
+
+            except (RateLimitExceeded, ServiceUnavailable, OSError) as exc:
+                # 通信できない場合（サーバー障害や回数制限を含む）は学習済みの単語で翻訳する
+                # トークンやプロジェクトの誤り等のクライアントエラーはそのまま表示する
+                offline = None
+                if not self._is_client_error(exc):
+                    offline = self._translate_offline(fetch_query.text)
+                if offline:
+                    (result, words), source = offline, "offline"
+                    succeeded = True
+                    self._stats.increment("offline_fallback")
+                else:
+                    suggestions.append(self._create_fetch_error_item(user_input, exc))
+            except Exception as exc:
+                suggestions.append(self._create_fetch_error_item(user_input, exc))
+
+            # ローカルの結果はケース変換されていない
+            items_start = time.monotonic()
+            raw_result = result
+            if succeeded and (fetch_query is not query or source):
+                result = self._render_result(query, result)
+            self.dbg(result, words)
+
+            # 待っている間に新しい入力があった場合は古い結果を捨てる
+            snapshot = self.Snapshot(generation, query, result, tuple(words))
+            if not self._publish_snapshot(snapshot):
+                self._stats.increment("stale")
+                self.dbg("Discarded stale result:", query)
                 return
 
-            self._result = self.Result(False, '', '')
-            self._words = []
+            # 失敗した場合はローカルの結果を残す
+            if succeeded:
+                suggestions.append(self._create_result_item(query, result, source=source))
+                if preview:
+                    suggestions.extend(self._create_preview_items(query, raw_result, source))
+                suggestions.extend(self._create_alternative_items(query, result, snapshot.words))
+                suggestions.extend(self._create_history_items(query, set(item.label() for item in suggestions)))
+            elif local_items:
+                suggestions.extend(local_items)
+            elif not offline_reason:
+                suggestions.append(self._create_result_item(query, result))
+            word = self._get_current_word(snapshot, items_chain)
+            if word:
+                is_last = (word == snapshot.words[-1])
+                suggestions.extend(self._create_candidate_items(query, result.successful, word, "", is_last))
 
-            try:
-                opener = kpnet.build_urllib_opener()
-                req = self._build_api_request(self._query)
+        if suggestions:
+            self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
 
-                with opener.open(req) as conn:
-                    response = conn.read()
-                if self.should_terminate():
-                    return
+        if len(query.text):
+            now = time.monotonic()
+            self._stats.record("items", now - items_start)
+            self._stats.record("total", now - start)
 
-                self._result, self._words = self._parse_api_response(response)
+    def _on_suggest_translate_lines(self, user_input, generation, query):
+        suggestions = []
 
-                self.dbg(self._result, self._words)
+        queries = self._split_lines(query)
 
-            except urllib.error.HTTPError as exc:
-                suggestions.append(self.create_error_item(
-                    label=user_input, short_desc=str(exc)))
-            except Exception as exc:
-                suggestions.append(self.create_error_item(
-                    label=user_input, short_desc="Error: " + str(exc)))
-                traceback.print_exc()
+        with self._stats.timer("idle"):
+            terminated = self.should_terminate(self._get_idle_time(query))
+        if terminated:
+            self._stats.increment("cancelled")
+            return
 
-            suggestions.append(self._create_result_item(self._query, self._result))
-            word = self._get_current_word(items_chain)
-            if word:
-                is_last = (word == self._words[-1])
-                suggestions.extend(self._create_candidate_items(self._query, self._result.successful, word, "", is_last))
+        try:
+            for i, (line_query, (result, _)) in enumerate(zip(queries, self._translate_many(queries))):
+                suggestions.append(self._create_result_item(line_query, result, "result/{}".format(i)))
+            if self.should_terminate():
+                return
+
+        except Exception as exc:
+            suggestions.append(self._create_fetch_error_item(user_input, exc))
+
+        if not self._publish_snapshot(self.Snapshot(generation, query, self.Result(False, '', ''), ())):
+            return
+
+        if suggestions:
+            self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
+
+    def _on_suggest_stats(self, user_input, items_chain, current_item):
+        suggestions = [
+            self._create_stats_line_item(line, "stats/{}".format(i))
+            for i, line in enumerate(self._format_stats())]
 
         if suggestions:
             self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
@@ -203,11 +477,14 @@ class Codic(kp.Plugin):
     def _on_suggest_candidate(self, user_input, items_chain, current_item):
         suggestions = []
 
-        word = self._get_current_word(items_chain)
+        snapshot = self._snapshot
+        word = self._get_current_word(snapshot, items_chain)
         if word:
-            is_last = (word == self._words[-1])
+            # ここまでに選んだ候補（履歴の記録用）
+            self._candidate_choices = tuple(int(item.target()) for item in items_chain[1:])
+            is_last = (word == snapshot.words[-1])
             decided = self._remove_open_box(current_item.label())
-            suggestions.extend(self._create_candidate_items(self._query, self._result.successful, word, decided, is_last))
+            suggestions.extend(self._create_candidate_items(snapshot.query, snapshot.result.successful, word, decided, is_last))
 
         if suggestions:
             self.set_suggestions(suggestions, kp.Match.ANY, kp.Sort.NONE)
@@ -220,17 +497,24 @@ class Codic(kp.Plugin):
             self._on_execute_result(item, action)
         elif item.category() == self.ITEMCAT_CANDIDATE:
             self._on_execute_candidate(item, action)
+        elif item.category() == self.ITEMCAT_STATS:
+            self._on_execute_stats(item, action)
 
     def _on_execute_translate(self, item, action):
         pass
 
     def _on_execute_result(self, item, action):
-        url = self._build_browse_url(self._query)
         name = action.name() if action else self.ACTION_COPY_RESULT
 
+        snapshot = self._snapshot
+        url = self._build_browse_url(snapshot.query) if snapshot else ""
+        if not url and name != self.ACTION_COPY_RESULT:
+            return
+
         if name == self.ACTION_COPY_RESULT:
             decided = self._remove_open_box(item.label())
             kpu.set_clipboard(decided)
+            self._record_history(item, decided)
         elif name == self.ACTION_BROWSE:
             kpu.web_browser_command(private_mode=False, url=url, execute=True)
         elif name == self.ACTION_BROWSE_PRIVATE:
@@ -241,25 +525,42 @@ class Codic(kp.Plugin):
     def _on_execute_candidate(self, item, action):
         decided = self._remove_open_box(item.label())
         kpu.set_clipboard(decided)
+        self._record_history(item, decided)
+
+    def _on_execute_stats(self, item, action):
+        kpu.set_clipboard("\n".join(self._format_stats()))
 
     # LaunchBoxが表示された時
     def on_activated(self):
-        pass
+        # 入力中に接続を済ませておく
+        self._start_preconnect()
 
     # LaunchBoxが非表示になった時
     def on_deactivated(self):
-        self._query = None
-        self._result = None
-        self._words = {}
+        # 実行中の問い合わせの結果と先読みは捨てる
+        self._next_generation()
+        self._snapshot = None
+        if self._prefetcher:
+            self._prefetcher.cancel()
+
+        self._save_state(self._cache, "translation cache")
+        self._save_state(self._limiter, "request limit state")
+        self._save_state(self._prefetch_limiter, "prefetch request limit state")
+        self._save_state(self._lexicon, "lexicon")
+        self._save_state(self._history, "history")
 
     # 何かしらのイベント発生時
     def on_events(self, flags):
         # コンフィグ変更時
         if flags & (kp.Events.APPCONFIG | kp.Events.PACKCONFIG | kp.Events.NETOPTIONS):
-            self._read_config()
-            self.on_catalog()
-
-    # コンフィグを読み込む
+            # カタログ項目が変わった場合だけ作り直す
+            if self._read_config():
+                self.on_catalog()
+        # ネットワーク設定変更時は接続を作り直す
+        if flags & kp.Events.NETOPTIONS:
+            self._build_client()
+
+    # コンフィグを読み込む（カタログ項目が変わった場合は True を返す）
     def _read_config(self):
         def _warn_lang_code(name, section, fallback):
             fmt = (
@@ -273,24 +574,64 @@ class Codic(kp.Plugin):
                 "Skipping custom item.")
             self.warn(fmt.format(name, section))
 
-        catalog = []
         settings = self.load_settings()
+        stats_item = self.STATS_ITEM
 
         self.dbg('load setting.')
 
         # [default_item]
+        # 前回の設定から消した値が残らないように、クラスの既定値から読み直す
+        self.DEFAULT_SECTION = type(self).DEFAULT_SECTION
         self.DEFAULT_SECTION = self._create_section(settings, self.CONFIG_SECTION_DEFAULTS, self.DEFAULT_SECTION.item_label)
         self.DEFAULT_IDLE_TIME = settings.get_float("idle_time", section=self.CONFIG_SECTION_DEFAULTS, fallback=self.DEFAULT_IDLE_TIME, min=0.25, max=3)
+        self.ADAPTIVE_IDLE_TIME = settings.get_bool("adaptive_idle_time", section=self.CONFIG_SECTION_DEFAULTS, fallback=True)
+        if self._debouncer:
+            self._debouncer.initial_wait = self.DEFAULT_IDLE_TIME
+        self.LOCAL_CASING = settings.get_bool("local_casing", section=self.CONFIG_SECTION_DEFAULTS, fallback=False)
+        self.CANONICALIZE_QUERY = settings.get_bool("canonicalize_query", section=self.CONFIG_SECTION_DEFAULTS, fallback=True)
+        self.TWO_PHASE = settings.get_bool("local_preview", section=self.CONFIG_SECTION_DEFAULTS, fallback=True)
+        self.OFFLINE_FAST_PATH = settings.get_bool("offline_fast_path", section=self.CONFIG_SECTION_DEFAULTS, fallback=False)
+        self.HISTORY_COUNT = settings.get_int("history_count", section=self.CONFIG_SECTION_DEFAULTS, fallback=3, min=0, max=20)
+        self.ALTERNATIVE_COUNT = settings.get_int("alternative_count", section=self.CONFIG_SECTION_DEFAULTS, fallback=5, min=0, max=50)
+        self.PROJECT_SYNC_INTERVAL = settings.get_float("project_sync_interval", section=self.CONFIG_SECTION_DEFAULTS, fallback=0, min=0)
+        self.PRECONNECT = settings.get_bool("preconnect", section=self.CONFIG_SECTION_DEFAULTS, fallback=True)
+        self.PRECONNECT_COOLDOWN = settings.get_float("preconnect_cooldown", section=self.CONFIG_SECTION_DEFAULTS, fallback=60, min=0)
+        self.VALIDATE_TOKEN = settings.get_bool("validate_token", section=self.CONFIG_SECTION_DEFAULTS, fallback=False)
+        self.PREFETCH_COUNT = settings.get_int("prefetch_count", section=self.CONFIG_SECTION_DEFAULTS, fallback=0, min=0, max=10)
+        self.PREFETCH_SHARE = settings.get_float("prefetch_share", section=self.CONFIG_SECTION_DEFAULTS, fallback=0.1, min=0, max=1)
+        self.STATS_ITEM = settings.get_bool("stats_item", section=self.CONFIG_SECTION_DEFAULTS, fallback=False)
+        self.STATS_LOG_INTERVAL = settings.get_float("stats_log_interval", section=self.CONFIG_SECTION_DEFAULTS, fallback=0, min=0)
         self.ACCESS_TOKEN = self._load_accesstoken(settings)
-
-        self.dbg(self.DEFAULT_SECTION, self.DEFAULT_IDLE_TIME, self.ACCESS_TOKEN)
-
-        self._sections = []
-
-        # 項目追加
+        # トークンが変わったかもしれないので再確認させる
+        self._token_error = None
+        self._preconnect_time = 0
+
+        self.dbg(self.DEFAULT_SECTION, self.DEFAULT_IDLE_TIME, self.LOCAL_CASING, self.ACCESS_TOKEN)
+
+        # キャッシュ
+        cache_size = settings.get_int("cache_size", section=self.CONFIG_SECTION_DEFAULTS, fallback=self.DEFAULT_CACHE_SIZE, min=0, max=100000)
+        cache_ttl = settings.get_float("cache_ttl", section=self.CONFIG_SECTION_DEFAULTS, fallback=self.DEFAULT_CACHE_TTL, min=0)
+        if self._cache:
+            self._cache.configure(cache_size, cache_ttl * 24 * 60 * 60)
+
+        # 回数制限
+        rate_limit = settings.get_int("rate_limit", section=self.CONFIG_SECTION_DEFAULTS, fallback=self.DEFAULT_RATE_LIMIT, min=0)
+        if self._limiter:
+            self._limiter.configure(rate_limit)
+        # 先読みは上限の PREFETCH_SHARE の分だけ使い、残りは入力した翻訳のために取っておく
+        if self._prefetch_limiter:
+            self._prefetch_limiter.configure(rate_limit * self.PREFETCH_SHARE)
+
+        # 通信の期限
+        self.REQUEST_TIMEOUT = settings.get_float("request_timeout", section=self.CONFIG_SECTION_DEFAULTS, fallback=5, min=0.5, max=60)
+        self.HEDGE_DELAY = settings.get_float("hedge_delay", section=self.CONFIG_SECTION_DEFAULTS, fallback=1, min=0, max=60)
+
+        self.dbg(cache_size, cache_ttl, rate_limit, self.REQUEST_TIMEOUT, self.HEDGE_DELAY)
+
+        # 項目の設定
+        sections = {}
         if self.DEFAULT_SECTION.enabled:
-            self._sections.append(self.DEFAULT_SECTION)
-            catalog.insert(0, self._create_translate_item(self.DEFAULT_SECTION, len(self._sections) - 1))
+            sections[self.CONFIG_SECTION_DEFAULTS] = self.DEFAULT_SECTION
 
         # [custom_item/*]
         for section_label in settings.sections():
@@ -302,31 +643,92 @@ class Codic(kp.Plugin):
                 self.warn('Invalid section name: "{}". Skipping section.'.format(section_label))
                 continue
 
-            self._sections.append(self._create_section(settings, section_label, section_name))
-            self.dbg(self._sections[-1])
+            section = self._create_section(settings, section_label, section_name)
+            self.dbg(section)
+            if section.enabled:
+                sections[section_label] = section
+
+        # 前回と異なる項目だけカタログ項目を作り直す
+        old_sections = self._sections
+        for target, section in sections.items():
+            if old_sections.get(target) != section or target not in self._catalog_items:
+                self._catalog_items[target] = self._create_translate_item(section, target)
+        for target in old_sections.keys() - sections.keys():
+            self._catalog_items.pop(target, None)
+        self._sections = sections
+
+        changed = (
+            list(old_sections.items()) != list(sections.items()) or
+            stats_item != self.STATS_ITEM)
+
+        # 使わなくなったプロジェクトのキャッシュは捨てる
+        project_ids = set(section.project_id for section in sections.values() if section.project_id)
+        old_project_ids = set(section.project_id for section in old_sections.values() if section.project_id)
+        self._invalidate_projects(old_project_ids - project_ids)
+
+        # 使用するプロジェクトの登録語を読み込み、少し待ってから同期する
+        if self._projects:
+            try:
+                self._projects.load(sorted(project_ids))
+            except Exception as exc:
+                self.warn("Failed to load projects. Error: {}".format(exc))
+            self._schedule_project_sync(self.PROJECT_SYNC_DELAY)
+
+        self._schedule_stats_log()
+
+        return changed
+
+    # カタログを作成する（作成済みの項目を使う）
+    def _build_catalog(self):
+        catalog = [self._catalog_items[target] for target in self._sections]
 
-            # 項目追加
-            catalog.append(self._create_translate_item(self._sections[-1], len(self._sections) - 1))
+        # 統計項目
+        if self.STATS_ITEM:
+            if not self._stats_item:
+                self._stats_item = self._create_stats_item()
+            catalog.append(self._stats_item)
 
         return catalog
 
-    def _create_item_desc(self, obj, text=None, word=None):
-        # pascal, camel 時しか有効でないため無視する
-        acronym_style = obj.acronym_style if obj.acronym_style else "default"
-        acronym_style = acronym_style if (obj.casing in {"pascal", "camel"}) else ""
+    # プロジェクトの結果をキャッシュから消す
+    def _invalidate_projects(self, project_ids):
+        if not project_ids or not self._cache:
+            return
+        # 読み込んだキャッシュのキーはただのタプルなので位置で見る
+        count = self._cache.invalidate(lambda key: key[1] in project_ids)
+        self.dbg("Invalidated {} cache entries of projects: {}".format(count, sorted(project_ids)))
+
+    # 項目やクエリの表示形式を取得する（なければ作成する）
+    def _get_profile(self, obj):
+        key = api.normalize_query(self.Query("", obj.project_id, obj.casing, obj.acronym_style))[1:]
+        profile = self._profiles.get(key)
+        if profile is None:
+            profile = self._profiles[key] = self._compile_profile(*key)
+        return profile
+
+    # 表示形式を作成する
+    def _compile_profile(self, project_id, casing, acronym_style):
+        # pascal, camel 時しか有効でない（それ以外は normalize_query で空になっている）
+        label = acronym_style if acronym_style else ("default" if casing in api.ACRONYM_CASINGS else "")
         # 長いので短く
-        if acronym_style == "ms naming guidelines":
-            acronym_style = "ms"
-        elif acronym_style == "camel strict":
-            acronym_style = "strict"
-
-        return "Codic Translate {}({}{}):{}{}".format(
-            "[{}] ".format(obj.project_id) if obj.project_id else "",
-            "{}".format(obj.casing) if obj.casing else "default",
-            ", {}".format(acronym_style) if acronym_style else "",
+        if label == "ms naming guidelines":
+            label = "ms"
+        elif label == "camel strict":
+            label = "strict"
+
+        bag = "{}({}{}):".format(
+            "[{}] ".format(project_id) if project_id else "",
+            "{}".format(casing) if casing else "default",
+            ", {}".format(label) if label else "")
+        return self.Profile("Codic Translate " + bag, bag, api.compile_casing(casing, acronym_style))
+
+    # 項目の説明とデータを作成する（入力、単語、取得元を表示形式に付け加える）
+    def _create_item_desc(self, profile, text=None, word=None, source=None):
+        suffix = "{}{}{}".format(
             " {}".format(text) if text else "",
-            " [{}]".format(word) if word else ""
-        )
+            " [{}]".format(word) if word else "",
+            " ({})".format(source) if source else "")
+        return profile.desc + suffix, profile.bag + suffix
 
     # エラー項目を作成
     def _create_error_item(self, label, desc):
@@ -337,48 +739,216 @@ class Codic(kp.Plugin):
             short_desc=desc
         )
 
+    # 翻訳の問い合わせに失敗した時のエラー項目を作成
+    def _create_fetch_error_item(self, user_input, exc):
+        if isinstance(exc, RateLimitExceeded):
+            # 回数制限中はキャッシュにあるものだけ表示する
+            return self._create_error_item(
+                user_input, "{}. Only cached translations are available.".format(exc))
+        elif isinstance(exc, (ServiceUnavailable, TimeoutError, PermissionError)):
+            return self._create_error_item(user_input, str(exc))
+        elif isinstance(exc, urllib.error.HTTPError):
+            return self.create_error_item(label=user_input, short_desc=str(exc))
+
+        traceback.print_exc()
+        return self.create_error_item(label=user_input, short_desc="Error: " + str(exc))
+
     # 翻訳表示に遷移する項目を作成
-    def _create_translate_item(self, section, index):
-        desc = self._create_item_desc(section)
+    def _create_translate_item(self, section, target):
+        desc = self._get_profile(section).desc
 
         return self.create_item(
             category=self.ITEMCAT_TRANSLATE,
             label=section.item_label,
             short_desc=desc,
-            target=str(index),
+            target=target,
             args_hint=kp.ItemArgsHint.REQUIRED,
             hit_hint=kp.ItemHitHint.NOARGS)
 
+    # 統計のカタログ項目を作成
+    def _create_stats_item(self):
+        return self.create_item(
+            category=self.ITEMCAT_STATS,
+            label=self.STATS_ITEM_LABEL,
+            short_desc="Codic latency and counters since startup",
+            target="stats",
+            args_hint=kp.ItemArgsHint.ACCEPTED,
+            hit_hint=kp.ItemHitHint.NOARGS)
+
+    # 統計の1行分の項目を作成（選択すると全体をコピーする）
+    def _create_stats_line_item(self, line, target):
+        return self.create_item(
+            category=self.ITEMCAT_STATS,
+            label=line,
+            short_desc="Copy all statistics to clipboard",
+            target=target,
+            args_hint=kp.ItemArgsHint.FORBIDDEN,
+            hit_hint=kp.ItemHitHint.IGNORE)
+
     # 翻訳結果の項目を作成
-    def _create_result_item(self, query, result):
-        desc = self._create_item_desc(query, query.text)
+    def _create_result_item(self, query, result, target="result", source=None):
+        # APIの結果でない場合は取得元を表示する
+        desc, bag = self._create_item_desc(self._get_profile(query), query.text, source=source)
 
         item = self.create_item(
             category=self.ITEMCAT_RESULT,
             label=result.translated,
             short_desc=desc,
-            target="result",
+            target=target,
             args_hint=kp.ItemArgsHint.FORBIDDEN,
             hit_hint=kp.ItemHitHint.IGNORE)
-
-        bag = desc.replace("Codic Translate ", "")
         item.set_data_bag(bag)
 
         return item
 
+    # ケース指定なしの結果を全てのケースと頭字語の扱いで表示する項目を作成（クエリと同じものは除く）
+    def _create_preview_items(self, query, result, source=None):
+        items = []
+        # 頭字語の扱いは pascal, camel 時しか有効でない
+        for casing, acronym_style in api.iter_casings():
+            style_query = self.Query(query.text, query.project_id, casing, acronym_style)
+            if self._create_cache_key(style_query) == self._create_cache_key(query):
+                continue
+            items.append(self._create_result_item(
+                style_query,
+                self._render_result(style_query, result),
+                "preview/{}/{}".format(casing, acronym_style),
+                source))
+        return items
+
+    # 単語毎の候補を組み合わせた識別子を、順位の高いものから作成する（翻訳結果と同じものは除く）
+    def _create_alternative_items(self, query, result, words):
+        if self.ALTERNATIVE_COUNT <= 0 or not words:
+            return []
+
+        profile = self._get_profile(query)
+        desc, bag = self._create_item_desc(profile, query.text, source="alternative")
+        combine = profile.combine
+
+        costs = [self._get_candidate_costs(word) for word in words]
+        labels = {result.translated}
+        items = []
+        # 同じ識別子ばかり続いても打ち切る
+        for _, indices in itertools.islice(iter_best(costs), self.ALTERNATIVE_COUNT * 10):
+            label = ""
+            for word, i in zip(words, indices):
+                candidate = word.candidates[i]
+                # Noneは訳さない単語（成功していない場合は原文のまま）
+                if candidate is None:
+                    if word.successful:
+                        continue
+                    candidate = word.text
+                for part in candidate.split(' '):
+                    label = combine(part, label)
+
+            if not label or label in labels:
+                continue
+            labels.add(label)
+
+            item = self.create_item(
+                category=self.ITEMCAT_RESULT,
+                label=label,
+                short_desc=desc,
+                target="alternative/{}".format(",".join(str(i) for i in indices)),
+                args_hint=kp.ItemArgsHint.FORBIDDEN,
+                hit_hint=kp.ItemHitHint.IGNORE)
+            item.set_data_bag(bag)
+            items.append(item)
+            if len(items) >= self.ALTERNATIVE_COUNT:
+                break
+
+        return items
+
+    # 単語の候補毎の順位付け用のコスト（小さいほど上位、よく選ばれる候補ほど上げる）
+    def _get_candidate_costs(self, word):
+        return [
+            i - self.HISTORY_WEIGHT * math.log1p(self._history.choice_count(word.text, candidate))
+            for i, candidate in enumerate(word.candidates)]
+
+    # 入力に一致する履歴の項目を作成する（labels にあるものは除く）
+    def _create_history_items(self, query, labels):
+        items = []
+        for text, identifier, _ in self._history.search(query.text, self._get_history_style(query), self.HISTORY_COUNT):
+            if identifier in labels:
+                continue
+            items.append(self._create_result_item(
+                query,
+                self.Result(True, text, identifier),
+                "history/{}".format(len(items)),
+                "history: {}".format(text)))
+        return items
+
+    # 履歴を記録する
+    def _record_history(self, item, identifier):
+        snapshot = self._snapshot
+        if not snapshot or not snapshot.query or not snapshot.query.text:
+            return
+
+        query = snapshot.query
+        target = item.target()
+        if target.startswith("preview/"):
+            _, casing, acronym_style = target.split("/", 2)
+            query = self.Query(query.text, query.project_id, casing, acronym_style)
+        elif target.startswith("result/"):
+            # 複数行の翻訳は選ばれた行の入力で記録する
+            queries = self._split_lines(query)
+            index = int(target[len("result/"):])
+            if index >= len(queries):
+                return
+            query = queries[index]
+
+        self._history.record(
+            query.text, identifier, self._get_history_style(query),
+            self._get_word_choices(snapshot, target))
+
+    # 複数行の入力を行毎の問い合わせにする（空行は除く）
+    def _split_lines(self, query):
+        return [
+            self.Query(line.strip(), query.project_id, query.casing, query.acronym_style)
+            for line in query.text.splitlines() if line.strip()]
+
+    # 項目を作るのに選ばれた (単語, 訳語) のリスト
+    def _get_word_choices(self, snapshot, target):
+        words = snapshot.words
+        if target.startswith("alternative/"):
+            indices = [int(i) for i in target[len("alternative/"):].split(",")]
+        elif target.isdigit():
+            indices = list(self._candidate_choices) + [int(target)]
+        elif target == "result" or target.startswith("preview/"):
+            indices = [0] * len(words)
+        else:
+            return []
+
+        return [
+            (word.text, word.candidates[i])
+            for word, i in zip(words, indices)
+            if word.successful and i < len(word.candidates) and word.candidates[i]]
+
+    # 履歴を区別するためのケースと頭字語の扱い
+    def _get_history_style(self, query):
+        key = self._create_cache_key(query)
+        return "{}/{}".format(key.casing, key.acronym_style) if key.acronym_style else key.casing
+
     # 翻訳候補の項目を作成
     def _create_candidate_items(self, query, is_successful, word, decided, is_last=False):
-        desc = self._create_item_desc(query, query.text, word.text)
+        profile = self._get_profile(query)
+        desc, bag = self._create_item_desc(profile, query.text, word.text)
+        combine = profile.combine
+
+        # よく選ばれる候補を上にする（target は元の順番のまま）
+        costs = self._get_candidate_costs(word)
+        order = sorted(range(len(word.candidates)), key=costs.__getitem__)
 
         items = []
-        for i, candidate in enumerate(word.candidates):
+        for i in order:
+            candidate = word.candidates[i]
             # Noneの場合は成功かどうかを見て上書き
             if candidate is None:
                 candidate = "␣" if is_successful else word.text
             # 複数の単語からなる文字列の場合があるため分割
             label = decided
-            for word in candidate.split(' '):
-                label = self._get_convined_word(query, word, label)
+            for part in candidate.split(' '):
+                label = combine(part, label)
             item = self.create_item(
                 category=self.ITEMCAT_RESULT if is_last else self.ITEMCAT_CANDIDATE,
                 label=label,
@@ -388,8 +958,6 @@ class Codic(kp.Plugin):
                 hit_hint=kp.ItemHitHint.IGNORE,
                 loop_on_suggest=False if is_last else True
             )
-
-            bag = desc.replace("Codic Translate ", "")
             item.set_data_bag(bag)
             items.append(item)
 
@@ -407,87 +975,455 @@ class Codic(kp.Plugin):
             settings.get_stripped("item_label", section=section_label, fallback=section_name),
             settings.get_stripped("project_id", section=section_label, fallback=self.DEFAULT_SECTION.project_id),
             casing,
-            acronym_style
+            acronym_style,
+            settings.get_bool("preview", section=section_label, fallback=self.DEFAULT_SECTION.preview)
         )
 
+    # 全てのケースを表示する項目かどうか
+    def _is_preview(self, item):
+        section = self._sections.get(item.target())
+        return section is not None and section.preview
+
     # 入力からクエリを作成
     def _extract_search_query(self, item, user_input):
         self.dbg(item.label(), item.target())
-        index = int(item.target())
-        if len(self._sections) <= index:
+        section = self._sections.get(item.target())
+        if section is None:
             return None
 
-        section = self._sections[index]
         text = user_input.strip() if user_input else ''
+        # 表記の揺れを揃えてキャッシュ等に当たりやすくする
+        if self.CANONICALIZE_QUERY:
+            text = canonicalize(text)
 
         return self.Query(text, section.project_id, section.casing, section.acronym_style)
 
     # レスポンスから結果と単語別の候補を作成
     def _parse_api_response(self, response):
-        response = response.decode(encoding="utf-8", errors="strict")
-        response = response.replace(",,", ",null,").replace("[,", "[null,")
-
-        data = json.loads(response)[0]
-        result = self.Result(
-            data['successful'],
-            data['text'],
-            data['translated_text']
-        )
+        return self._parse_api_responses(response)[0]
+
+    # レスポンスから複数件分の結果と単語別の候補を作成
+    def _parse_api_responses(self, response):
+        return api.parse_api_responses(response)
+
+    # API問い合わせ用のクエリを作成する（ローカル変換時はケース指定なし）
+    def _create_fetch_query(self, query, force_local=False):
+        if not (self.LOCAL_CASING or force_local) or not (query.casing or query.acronym_style):
+            return query
+        return self.Query(query.text, query.project_id, "", "")
+
+    # ケース指定なしの結果をクエリのケースに変換する
+    def _render_result(self, query, result):
+        return api.render_result(query, result)
+
+    # 通信せずに用意できる項目を作成する
+    def _create_local_items(self, query):
+        items = []
+        fetch_query = self._create_fetch_query(query)
+
+        # 学習済みの単語による翻訳
+        offline = self._translate_offline(fetch_query.text)
+        if offline:
+            result = self._render_result(query, offline[0])
+            items.append(self._create_result_item(query, result, "local/offline", "local, offline"))
+
+        # 入力の先頭部分で最も長いキャッシュ
+        for end in range(len(query.text) - 1, 0, -1):
+            prefix = query.text[:end].rstrip()
+            cached = self._cache.peek(self._create_cache_key(fetch_query._replace(text=prefix)))
+            if cached is None:
+                continue
+
+            result = cached[0]
+            if fetch_query is not query:
+                result = self._render_result(query, result)
+            items.append(self._create_result_item(
+                query, result, "local/prefix", "local, prefix: {}".format(prefix)))
+            break
+
+        # 過去にコピーした識別子
+        items.extend(self._create_history_items(query, set(item.label() for item in items)))
+        return items
+
+    # 翻訳を問い合わせる（同じクエリの問い合わせ中はその結果を共有する）
+    def _fetch_translation(self, fetch_query):
+        cache_key = self._create_cache_key(fetch_query)
+
+        def _fetch():
+            req = self._build_api_request(fetch_query)
+            body = self._open_api(req).body
+            with self._stats.timer("parse"):
+                value = self._parse_api_response(body)
+            self._cache.put(cache_key, value)
+            self._learn_words(fetch_query.text, value[1])
+            return value
+
+        return self._single_flight.do(cache_key, _fetch)
+
+    # APIに問い合わせる（回数制限を超える場合は問い合わせない）
+    # 期限を過ぎても応答がない場合や、遅い場合の再送も含めて制御する
+    # background の場合は入力中の問い合わせとは別のスレッドで送信し、待つ人がいないので再送しない
+    # prefetch の場合は先読み用の回数の範囲で問い合わせ、失敗は入力した翻訳とは別に数える
+    def _open_api(self, req, background=False, prefetch=False):
+        errors = "prefetch_errors" if prefetch else "errors"
+        if prefetch:
+            # 障害からの復旧確認の1件は入力した翻訳のために取っておく
+            if self._breaker.state != CircuitBreaker.CLOSED:
+                self._stats.increment("prefetch_skipped")
+                raise ServiceUnavailable(self._breaker.retry_after())
+            if not self._prefetch_limiter.try_acquire() or not self._limiter.try_acquire():
+                self._stats.increment("prefetch_skipped")
+                raise RateLimitExceeded(self._prefetch_limiter.retry_after())
+        else:
+            # 障害中は復旧確認まで問い合わせない
+            if not self._breaker.allow():
+                self._stats.increment("unavailable")
+                raise ServiceUnavailable(self._breaker.retry_after())
+            if not self._limiter.try_acquire():
+                self._stats.increment("rate_limited")
+                raise RateLimitExceeded(self._limiter.retry_after())
+        self._stats.increment("requests")
+
+        client = self._client
+        start = time.monotonic()
+        try:
+            response = hedged_call(
+                self._background_executor if background else self._executor,
+                lambda: client.open(req, timeout=self.REQUEST_TIMEOUT),
+                self.REQUEST_TIMEOUT,
+                0 if background else self.HEDGE_DELAY,
+                can_hedge=self._limiter.try_acquire)
+        except urllib.error.HTTPError as exc:
+            self._stats.increment(errors)
+            self._limiter.update_from_headers(exc.headers)
+            if exc.code == 429:
+                retry_after = exc.headers.get("Retry-After") if exc.headers else None
+                self._limiter.exhaust(float(retry_after) if retry_after and retry_after.isdigit() else None)
+            # サーバー側の障害以外は応答があったので正常とみなす
+            if exc.code >= 500:
+                self._breaker.record_failure()
+            else:
+                self._breaker.record_success()
+            raise
+        except Exception:
+            self._stats.increment(errors)
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success()
+        self._debouncer.record_latency(time.monotonic() - start)
+        self._stats.record("request", time.monotonic() - start)
+        self._limiter.update_from_headers(response.headers)
+
+        self.dbg("Remaining requests:", self._limiter.remaining())
+        return response
+
+    # 問い合わせ前の待ち時間を決める
+    def _get_idle_time(self, query):
+        if not self.ADAPTIVE_IDLE_TIME:
+            return self.DEFAULT_IDLE_TIME
+
+        idle_time = self._debouncer.wait_time(len(query.text))
+        self.dbg("Idle time: {:.3f}s (interval: {}, latency: {})".format(
+            idle_time, self._debouncer.interval(), self._debouncer.latency()))
+        return idle_time
+
+    # 入力毎の世代を進める
+    def _next_generation(self):
+        with self._generation_lock:
+            self._generation += 1
+            return self._generation
+
+    # 最新の世代の場合のみ表示中の状態を差し替える
+    def _publish_snapshot(self, snapshot):
+        with self._generation_lock:
+            if snapshot.generation != self._generation:
+                return False
+            self._snapshot = snapshot
+            return True
+
+    # 複数のクエリをまとめて翻訳する（キャッシュにないものだけ問い合わせる）
+    def _translate_many(self, queries):
+        fetch_queries = [self._create_fetch_query(query) for query in queries]
+        values = [self._cache.get(self._create_cache_key(query)) for query in fetch_queries]
+
+        futures = {}
+        groups = set()
+        for i, fetch_query in enumerate(fetch_queries):
+            if values[i] is None:
+                group = (fetch_query.project_id, fetch_query.casing, fetch_query.acronym_style)
+                futures[i] = self._batcher.submit(group, fetch_query.text)
+                groups.add(group)
+
+        # 揃うのを待たずに送信する
+        for group in groups:
+            self._batcher.flush(group)
+        for i, future in futures.items():
+            values[i] = future.result()
+
+        results = []
+        for query, fetch_query, (result, words) in zip(queries, fetch_queries, values):
+            if fetch_query is not query:
+                result = self._render_result(query, result)
+            results.append((result, words))
+        return results
+
+    # まとめた翻訳依頼を1回のリクエストで送信する（prefetch の場合は先読みとして送信する）
+    def _send_batch(self, group, texts, prefetch=False):
+        project_id, casing, acronym_style = group
+        query = self.Query("\n".join(texts), project_id, casing, acronym_style)
+
+        req = self._build_api_request(query)
+        body = self._open_api(req, background=prefetch, prefetch=prefetch).body
+        with self._stats.timer("parse"):
+            values = self._parse_api_responses(body)
+
+        for text, value in zip(texts, values):
+            cache_key = self._create_cache_key(self.Query(text, project_id, casing, acronym_style))
+            self._cache.put(cache_key, value)
+            self._learn_words(text, value[1])
+        return values
+
+    # 先読みの翻訳依頼を送信する（回数制限のうち先読みに使える分だけ使う）
+    def _send_prefetch_batch(self, group, texts):
+        return self._send_batch(group, texts, prefetch=True)
+
+    # 次に入力されそうなクエリの先読みを依頼する
+    def _start_prefetch(self, query, fetch_query):
+        if self.PREFETCH_COUNT <= 0 or self.PREFETCH_SHARE <= 0:
+            return
+
+        keys = []
+        for text in self._get_prefetch_texts(query):
+            key = self._create_cache_key(fetch_query._replace(text=text))
+            if key in keys or self._cache.peek(key) is not None:
+                continue
+            # プロジェクトの登録語は問い合わせなくても分かる
+            if key.project_id and self._projects.lookup(key.project_id, key.text):
+                continue
+            keys.append(key)
+            if len(keys) >= self.PREFETCH_COUNT:
+                break
+
+        self._prefetcher.submit(keys)
+
+    # 先読みする入力の候補を可能性の高い順に返す
+    def _get_prefetch_texts(self, query):
+        # よく使う履歴のうち、入力の続きになっているもの
+        # 複数行のものはまとめた問い合わせの行数が合わなくなるため除く
+        return [
+            text for text in self._history.continuations(query.text, self.PREFETCH_COUNT)
+            if "\n" not in text]
+
+    # 先読みのワーカーで翻訳してキャッシュに入れる（取得したキーを返す）
+    def _prefetch(self, keys, cancelled):
+        groups = {}
+        for key in keys:
+            # 待っている間に取得済みになったものは問い合わせない
+            if self._cache.peek(key) is None:
+                groups.setdefault(tuple(key[1:]), []).append(key)
+
+        fetched = []
+        for group, group_keys in groups.items():
+            if cancelled():
+                break
+            futures = self._prefetch_batcher.submit_many(group, [key.text for key in group_keys])
+            for key, future in zip(group_keys, futures):
+                try:
+                    future.result()
+                except Exception as exc:
+                    self.dbg("Failed to prefetch: {}. Error: {}".format(key.text, exc))
+                    continue
+                fetched.append(key)
+
+        if fetched:
+            self._stats.increment("prefetched", len(fetched))
+        return fetched
+
+    # 問い合わせ方の誤りによるHTTPエラーか（サーバー障害と回数制限は除く）
+    def _is_client_error(self, exc):
+        return isinstance(exc, urllib.error.HTTPError) and exc.code < 500 and exc.code != 429
+
+    # 翻訳結果の単語を辞書に登録する
+    def _learn_words(self, text, words):
+        self._lexicon.learn(text, [(word.text, word.successful, word.candidates) for word in words])
+
+    # プロジェクトの登録語から翻訳する（登録されていない場合はNone）
+    def _translate_project(self, query):
+        candidates = self._projects.lookup(query.project_id, query.text)
+        if not candidates:
+            return None
+        word = self.Word(True, query.text, candidates[0], candidates)
+        return self.Result(True, query.text, candidates[0]), (word,)
+
+    # プロジェクトの登録語を取得する
+    def _fetch_project_entries(self, project_id, offset, count, since):
+        data = {'offset': offset, 'count': count}
+        if since:
+            data['updated_since'] = since
+        url = self.API_PROJECT_ENTRIES_URL.format(urllib.parse.quote(str(project_id))) + "?" + urllib.parse.urlencode(data)
+        req = urllib.request.Request(url, headers={'Authorization': 'Bearer {}'.format(self.ACCESS_TOKEN)})
+
+        entries = json.loads(self._open_api(req, background=True).body.decode(encoding="utf-8"))
+        return [
+            (entry['text'], entry['translated_text'], entry.get('updated_at'))
+            for entry in entries if entry.get('text') and entry.get('translated_text')]
+
+    # プロジェクトの登録語の同期を予約する（前回の予約は取り消す）
+    def _schedule_project_sync(self, delay):
+        if self._project_sync_timer:
+            self._project_sync_timer.cancel()
+            self._project_sync_timer = None
+        if self.PROJECT_SYNC_INTERVAL <= 0 or not self._projects.project_ids():
+            return
+
+        self._project_sync_timer = threading.Timer(delay, self._sync_projects)
+        self._project_sync_timer.daemon = True
+        self._project_sync_timer.start()
+
+    def _sync_projects(self):
+        if self.ACCESS_TOKEN and self.ACCESS_TOKEN != "YOUR_ACCESS_TOKEN":
+            for project_id in self._projects.project_ids():
+                try:
+                    count = self._projects.sync(project_id)
+                    self.dbg("Synchronized project {}: {} entries".format(project_id, count))
+                    # 登録語が変わったプロジェクトの結果は問い合わせ直す
+                    if count:
+                        self._invalidate_projects({project_id})
+                except Exception as exc:
+                    self.warn("Failed to synchronize project {}. Error: {}".format(project_id, exc))
+            self._save_state(self._projects, "projects")
+
+        self._schedule_project_sync(self.PROJECT_SYNC_INTERVAL * 60)
+
+    # 統計を表示用の行にする（回数制限の残りも含める）
+    def _format_stats(self):
+        lines = self._stats.format_lines(self.STATS_PHASES)
+        remaining = self._limiter.remaining()
+        lines.append("quota: {} remaining, {} used".format(
+            remaining if remaining is not None else "unlimited", self._limiter.used()))
+        # 先読みした翻訳が使われた割合
+        prefetched = self._stats.counter("prefetched")
+        if prefetched:
+            hits = self._stats.counter("prefetch_hit")
+            lines.append("prefetch: {} of {} used ({:.0%})".format(hits, prefetched, hits / prefetched))
+        return lines
+
+    # 統計を定期的にログに出力する
+    def _schedule_stats_log(self):
+        if self._stats_timer:
+            self._stats_timer.cancel()
+            self._stats_timer = None
+        if self.STATS_LOG_INTERVAL <= 0:
+            return
+
+        self._stats_timer = threading.Timer(self.STATS_LOG_INTERVAL * 60, self._log_stats)
+        self._stats_timer.daemon = True
+        self._stats_timer.start()
+
+    def _log_stats(self):
+        for line in self._format_stats():
+            self.info("Stats: " + line)
+        self._schedule_stats_log()
+
+    # 学習済みの単語だけで翻訳する（1語も分からない場合はNone）
+    def _translate_offline(self, text):
+        segments = self._lexicon.segment(text)
+        if not any(candidates for _, candidates in segments):
+            return None
 
         words = []
-        for word in data['words']:
-            successful = word['successful']
-            text = word['text']
-            # 失敗した時は空配列になるため追加
-            translated = word['translated_text'] if successful else text
-            candidates = [candidate['text'] for candidate in word['candidates']] if successful else [text]
-            word = self.Word(
-                successful,
-                text,
-                translated,
-                candidates
-            )
-            # 成功していて結果が第1候補がNoneの時は無視する（を等）
-            if successful and translated is None:
-                pass
+        for segment, candidates in segments:
+            segment = segment.strip()
+            if not segment:
+                continue
+            if candidates is None:
+                words.append(self.Word(False, segment, segment, (segment,)))
+            elif candidates:
+                words.append(self.Word(True, segment, candidates[0], candidates))
+            # 空の候補は無視される語（を等）
+
+        successful = all(word.successful for word in words)
+        translated = " ".join(word.translated for word in words)
+        return self.Result(successful, text, translated), tuple(words)
+
+    # API通信用のクライアントを作成する（古い接続は閉じる）
+    def _build_client(self):
+        old_client = self._client
+        self._client = KeepAliveClient(proxies=kpnet.get_proxies(), observe=self._stats.record)
+        if old_client:
+            old_client.close()
+
+    # バックグラウンドで接続を確立する（クールダウン中や実行中は何もしない）
+    def _start_preconnect(self):
+        if not self.PRECONNECT or not self._client:
+            return
+        if not self.ACCESS_TOKEN or self.ACCESS_TOKEN == "YOUR_ACCESS_TOKEN":
+            return
+        if self._preconnect_thread and self._preconnect_thread.is_alive():
+            return
+
+        now = time.monotonic()
+        if self._preconnect_time and now - self._preconnect_time < self.PRECONNECT_COOLDOWN:
+            return
+        self._preconnect_time = now
+
+        self._preconnect_thread = threading.Thread(
+            target=self._preconnect, args=(self._client,), daemon=True)
+        self._preconnect_thread.start()
+
+    def _preconnect(self, client):
+        try:
+            if self.VALIDATE_TOKEN:
+                # 認証が必要で翻訳回数を消費しないAPIでトークンを確認する
+                req = urllib.request.Request(self.API_PROJECTS_URL, headers={
+                    'Authorization': 'Bearer {}'.format(self.ACCESS_TOKEN)})
+                client.open(req, timeout=self.REQUEST_TIMEOUT)
             else:
-                words.append(word)
+                client.preconnect(self.API_URL, timeout=self.REQUEST_TIMEOUT)
+            self.dbg("Preconnected to", self.API_URL)
 
-        return result, words
+        except urllib.error.HTTPError as exc:
+            if exc.code == 401:
+                self._token_error = "Access token is invalid! See codic configuration."
+            self.warn("Failed to validate access token. Error: {}".format(exc))
+        except Exception as exc:
+            self.dbg("Failed to preconnect. Error: {}".format(exc))
+
+    # キャッシュのキーを作成する（結果に影響しない値は揃える）
+    def _create_cache_key(self, query):
+        return api.normalize_query(query)
+
+    # キャッシュ保存用に変換する（タプルはそのままJSONの配列になる）
+    def _encode_cache_value(self, value):
+        return value
+
+    # キャッシュ保存用から復元する
+    def _decode_cache_value(self, value):
+        result, words = value
+        return self.Result(*result), tuple(
+            self.Word(successful, text, translated, tuple(candidates))
+            for successful, text, translated, candidates in words)
+
+    # キャッシュ・回数制限・履歴等の状態をファイルに保存する
+    def _save_state(self, store, name):
+        if not store:
+            return
+        try:
+            store.save()
+        except Exception as exc:
+            self.warn("Failed to save {}. Error: {}".format(name, exc))
 
     # APIアクセス用のURLを作成する
     def _build_api_request(self, query):
-        data = {
-            'text': query.text
-        }
-        if query.project_id:
-            data['project_id'] = query.project_id
-        if query.casing in self.API_CASING_DICT.keys():
-            data['casing'] = self.API_CASING_DICT[query.casing]
-        if query.acronym_style in self.API_ACRONYM_STYLE_DICT.keys():
-            data['acronym_style'] = self.API_ACRONYM_STYLE_DICT[query.acronym_style]
-        headers = {
-            'Authorization': 'Bearer {}'.format(self.ACCESS_TOKEN),
-            'Content-Type': 'application/json'
-        }
-
-        self.dbg(data, headers)
-
-        return urllib.request.Request(self.API_URL, json.dumps(data).encode(), headers)
+        req = api.build_api_request(query, self.ACCESS_TOKEN, self.API_URL)
+
+        self.dbg(api.build_params(query), req.headers)
+
+        return req
 
     # Webブラウズ用のURLを作成する
     def _build_browse_url(self, query):
-        data = {
-            'text': query.text
-        }
-        if query.project_id:
-            data['project_id'] = query.project_id
-        if query.casing in self.API_CASING_DICT.keys():
-            data['casing'] = self.API_CASING_DICT[query.casing]
-        if query.acronym_style in self.API_ACRONYM_STYLE_DICT.keys():
-            data['acronym_style'] = self.API_ACRONYM_STYLE_DICT[query.acronym_style]
-
-        return self.BROWSE_URL + urllib.parse.urlencode(data)
+        return api.build_browse_url(query, self.BROWSE_URL)
 
     # 空白記号が含まれていたら削除
     def _remove_open_box(self, text):
@@ -497,54 +1433,11 @@ class Codic(kp.Plugin):
 
 
     # 現在の単語を取得（選択済み項目数-1）
-    def _get_current_word(self, items_chain):
+    def _get_current_word(self, snapshot, items_chain):
+        if not snapshot:
+            return None
         i = len(items_chain) - 1
-        return self._words[i] if len(self._words) > i else None
-
-    # 確定済みのラベルに候補を結合する
-    def _get_convined_word(self, query, candidate, decided):
-        def _capitalize(query, candidate):
-            # 頭字語は全て大文字でcandidateに入っている
-            if candidate.isupper():
-                if query.acronym_style == 'ms naming guidelines':
-                    if len(candidate) <= 2:
-                        candidate = candidate.upper()
-                    else:
-                        candidate = candidate.capitalize()
-                elif query.acronym_style == 'camel strict':
-                    candidate = candidate.capitalize()
-                else:
-                    candidate = candidate
-            else:
-                candidate = candidate.capitalize()
-            return candidate
-
-        label = ''
-        if query.casing == 'camel':
-            # 最初の単語は必ず全て小文字
-            candidate = _capitalize(query, candidate)
-            candidate = candidate if decided else candidate.lower()
-            label = ''.join([x for x in [decided, candidate] if x])
-
-        elif query.casing == 'pascal':
-            candidate = _capitalize(query, candidate)
-            label = ''.join([x for x in [decided, candidate] if x])
-
-        elif query.casing == 'lower underscore':
-            candidate = candidate.lower()
-            label = '_'.join([x for x in [decided, candidate] if x])
-
-        elif query.casing == 'upper underscore':
-            candidate = candidate.upper()
-            label = '_'.join([x for x in [decided, candidate] if x])
-
-        elif query.casing == 'hyphen':
-            label = '-'.join([x for x in [decided, candidate] if x])
-
-        else:
-            label = ' '.join([x for x in [decided, candidate] if x])
-
-        return label
+        return snapshot.words[i] if len(snapshot.words) > i else None
 
     # アクセストークンを取得する
     def _load_accesstoken(self, settings):
@@ -0,0 +1,213 @@
+"""
+Codic APIの問い合わせと結果の変換
+
+Keypirinhaに依存しない処理のみを置き、プラグインと一括変換（lib.bulk）の両方から使う。
+"""
+
+from collections import namedtuple
+from functools import lru_cache
+from operator import itemgetter
+import json
+import re
+import urllib.parse
+import urllib.request
+
+# クエリ
+Query = namedtuple('Query', ('text', 'project_id', 'casing', 'acronym_style'))
+# 結果（第一候補の結果）
+Result = namedtuple('Result', ('successful', 'text', 'translated'))
+# 単語別の候補（candidates は文字列のタプル）
+# キャッシュや表示中の状態はこのタプルをそのまま共有するため変更しないこと
+Word = namedtuple('Word', ('successful', 'text', 'translated', 'candidates'))
+
+API_URL = "https://api.codic.jp/v1/engine/translate.json"
+BROWSE_URL = "https://codic.jp/engine?"
+
+CASING_DICT = {
+    "camel": "camel",
+    "pascal": "pascal",
+    "lower underscore": "lower underscore",
+    "upper underscore": "upper underscore",
+    "hyphen": "hyphen"
+}
+ACRONYM_STYLE_DICT = {
+    "ms naming guidelines": "MS naming guidelines",
+    "camel strict": "camel strict",
+    "literal": "literal"
+}
+
+# 頭字語の書き方が結果に影響するケース
+ACRONYM_CASINGS = {"pascal", "camel"}
+
+# エスケープされた引用符（手前の "\\" が奇数個）
+_ESCAPED_QUOTE_PATTERN = re.compile(rb'(?<!\\)(?:\\\\)*\\"')
+
+_get_text = itemgetter('text')
+
+# クエリをAPIのパラメータに変換する
+def build_params(query):
+    data = {
+        'text': query.text
+    }
+    if query.project_id:
+        data['project_id'] = query.project_id
+    if query.casing in CASING_DICT.keys():
+        data['casing'] = CASING_DICT[query.casing]
+    if query.acronym_style in ACRONYM_STYLE_DICT.keys():
+        data['acronym_style'] = ACRONYM_STYLE_DICT[query.acronym_style]
+    return data
+
+# APIアクセス用のリクエストを作成する
+def build_api_request(query, access_token, url=API_URL):
+    headers = {
+        'Authorization': 'Bearer {}'.format(access_token),
+        'Content-Type': 'application/json'
+    }
+    return urllib.request.Request(url, json.dumps(build_params(query)).encode(), headers)
+
+# Webブラウズ用のURLを作成する
+def build_browse_url(query, url=BROWSE_URL):
+    return url + urllib.parse.urlencode(build_params(query))
+
+# レスポンスから複数件分の結果と単語別の候補を作成
+def parse_api_responses(response):
+    return [parse_api_data(data) for data in loads_elided(response)]
+
+# 配列の要素が省略されたJSONを読み込む（省略された要素は None）
+# 省略がある時だけ、デコード前のバイト列の省略された位置に null を補う（文字列の中の ",," はそのまま）
+def loads_elided(response):
+    if b",," in response or b"[," in response:
+        response = _fill_elided(response)
+    # json.loads にバイト列を渡すと遅いエラー処理でデコードされるため先にデコードする
+    return json.loads(response.decode(encoding="utf-8", errors="strict"))
+
+# 省略された要素（"[,"、",,"）の位置のうち、文字列の外のものに null を補う
+def _fill_elided(response):
+    parts = []
+    start = 0
+    checked = 0
+    quotes = 0
+    comma = response.find(b",,")
+    bracket = response.find(b"[,")
+    while comma >= 0 or bracket >= 0:
+        if bracket < 0 or 0 <= comma < bracket:
+            site = comma
+            comma = response.find(b",,", comma + 1)
+        else:
+            site = bracket
+            bracket = response.find(b"[,", bracket + 1)
+        # 手前のエスケープされていない引用符が偶数なら文字列の外
+        quotes += response.count(b'"', checked, site)
+        if response.find(b"\\", checked, site) >= 0:
+            quotes -= len(_ESCAPED_QUOTE_PATTERN.findall(response, checked, site))
+        checked = site
+        if quotes % 2 == 0:
+            parts.append(response[start:site + 1])
+            parts.append(b"null")
+            start = site + 1
+    parts.append(response[start:])
+    return b"".join(parts)
+
+# 1件分の結果と単語別の候補を作成
+def parse_api_data(data):
+    result = Result(
+        data['successful'],
+        data['text'],
+        data['translated_text']
+    )
+
+    words = []
+    for word in data['words']:
+        # 省略された要素は無視する
+        if not word:
+            continue
+        successful = word['successful']
+        text = word['text']
+        if not successful:
+            # 失敗した時は空配列になるため追加
+            words.append(Word(successful, text, text, (text,)))
+            continue
+        translated = word['translated_text']
+        # 成功していて結果が第1候補がNoneの時は無視する（を等）
+        if translated is None:
+            continue
+        candidates = word['candidates']
+        if None in candidates:
+            candidates = [candidate for candidate in candidates if candidate]
+        words.append(Word(successful, text, translated, tuple(map(_get_text, candidates))))
+
+    return result, tuple(words)
+
+# ケース指定なしの結果をクエリのケースに変換する
+def render_result(query, result):
+    if not result.translated:
+        return result
+
+    combine = compile_casing(query.casing, query.acronym_style)
+    label = ""
+    for word in result.translated.split(' '):
+        label = combine(word, label)
+    return Result(result.successful, result.text, label)
+
+# ケースと頭字語の書き方毎の、決定済みの文字列に候補を結合する関数 combine(candidate, decided) を作る
+# 候補毎に設定を見て分岐しないように、組み合わせ毎に一度だけ作って使い回す
+@lru_cache(maxsize=64)
+def compile_casing(casing, acronym_style):
+    if casing in ACRONYM_CASINGS:
+        capitalize = _compile_capitalize(acronym_style)
+        if casing == 'camel':
+            # 最初の単語は必ず全て小文字
+            def combine(candidate, decided):
+                return decided + capitalize(candidate) if decided else capitalize(candidate).lower()
+        else:
+            def combine(candidate, decided):
+                return decided + capitalize(candidate)
+        return combine
+
+    if casing == 'lower underscore':
+        convert, separator = str.lower, '_'
+    elif casing == 'upper underscore':
+        convert, separator = str.upper, '_'
+    elif casing == 'hyphen':
+        convert, separator = str.lower, '-'
+    else:
+        convert, separator = None, ' '
+
+    def combine(candidate, decided):
+        if convert:
+            candidate = convert(candidate)
+        if decided and candidate:
+            return decided + separator + candidate
+        return decided or candidate
+    return combine
+
+# 頭字語の書き方に応じて単語の先頭を大文字にする関数を作る
+# 頭字語は全て大文字で候補に入っている（iPhone 等の大文字を含む登録語もある）
+def _compile_capitalize(acronym_style):
+    if acronym_style == 'ms naming guidelines':
+        def capitalize(candidate):
+            if candidate.isupper() and len(candidate) <= 2:
+                return candidate.upper()
+            return candidate.capitalize()
+        return capitalize
+    if acronym_style == 'camel strict':
+        return str.capitalize
+
+    # literal：大文字を含む登録語はそのまま使う
+    def capitalize(candidate):
+        return candidate if candidate != candidate.lower() else candidate.capitalize()
+    return capitalize
+
+# 結果に影響しない値を揃えたクエリを作成する（キャッシュのキー等）
+def normalize_query(query):
+    casing = query.casing if query.casing in CASING_DICT.keys() else ""
+    acronym_style = query.acronym_style if query.acronym_style in ACRONYM_STYLE_DICT.keys() else ""
+    acronym_style = acronym_style if casing in ACRONYM_CASINGS else ""
+    return Query(query.text, query.project_id, casing, acronym_style)
+
+# 全てのケースと頭字語の書き方の組を列挙する（ケースなしを除く）
+def iter_casings():
+    for casing in CASING_DICT.keys():
+        acronym_styles = ACRONYM_STYLE_DICT.keys() if casing in ACRONYM_CASINGS else [""]
+        for acronym_style in acronym_styles:
+            yield casing, acronym_style
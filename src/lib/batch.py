@@ -0,0 +1,82 @@
+from concurrent.futures import Future
+import threading
+
+class RequestBatcher:
+    """
+    翻訳依頼をまとめて1回のリクエストにするバッチャ
+
+    同じグループ（プロジェクトやケース等のパラメータ）の依頼を最大 MAX_TEXTS 件まで
+    まとめて send(group, texts) に渡し、戻り値のリストを依頼元のFutureに振り分ける。
+    件数が揃わない場合は linger 秒待ってから送信する。
+    """
+
+    # Codic APIが1回で受け付ける件数
+    MAX_TEXTS = 3
+
+    def __init__(self, send, linger=0.02):
+        self._send = send
+        self._linger = linger
+        # group -> [(text, future)]
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    # 依頼を追加してFutureを返す
+    def submit(self, group, text):
+        future = Future()
+        with self._lock:
+            pending = self._pending.setdefault(group, [])
+            pending.append((text, future))
+            is_first = (len(pending) == 1)
+            is_full = (len(set(text for text, _ in pending)) >= self.MAX_TEXTS)
+
+        if is_full:
+            self.flush(group)
+        elif is_first:
+            timer = threading.Timer(self._linger, self.flush, args=(group,))
+            timer.daemon = True
+            timer.start()
+        return future
+
+    # 複数の依頼をまとめて追加する
+    def submit_many(self, group, texts):
+        futures = [self.submit(group, text) for text in texts]
+        self.flush(group)
+        return futures
+
+    # グループの依頼を送信する
+    def flush(self, group):
+        while True:
+            with self._lock:
+                pending = self._pending.get(group)
+                if not pending:
+                    return
+                # 同じ文字列は1件として送る
+                texts = []
+                batch = []
+                while pending:
+                    text = pending[0][0]
+                    if text not in texts:
+                        if len(texts) >= self.MAX_TEXTS:
+                            break
+                        texts.append(text)
+                    batch.append(pending.pop(0))
+                if not pending:
+                    del self._pending[group]
+
+            self._dispatch(group, texts, batch)
+
+    def _dispatch(self, group, texts, batch):
+        try:
+            results = self._send(group, texts)
+            if len(results) != len(texts):
+                raise ValueError("Unexpected number of results: {} (expected {})".format(len(results), len(texts)))
+        except Exception as exc:
+            for _, future in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(exc)
+            return
+
+        results = dict(zip(texts, results))
+        for text, future in batch:
+            if future.set_running_or_notify_cancel():
+                future.set_result(results[text])
@@ -0,0 +1,310 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from . import api
+from .batch import RequestBatcher
+from .canonical import canonicalize
+from .client import KeepAliveClient
+from .ratelimit import RateLimiter
+from .store import load_json, save_json
+
+class BulkTranslator:
+    """
+    用語集（CSV/TSV）をまとめて識別子に変換する
+
+    入力を先頭から読みながら MAX_TEXTS 件ずつ1回のリクエストで問い合わせ、
+    ケース指定なしの結果を指定された全てのケースに変換して入力と同じ順に書き出す。
+    同時に concurrency 件まで問い合わせるが、回数制限に達した場合は回復を待つ。
+    書き出した行数と出力ファイルの位置をチェックポイントに保存するため、
+    中断しても同じ引数で再実行すれば続きから変換する。
+    """
+
+    MAX_TEXTS = RequestBatcher.MAX_TEXTS
+    FORMAT_VERSION = 1
+    # 一時的な失敗を再試行する回数と間隔
+    RETRY_COUNT = 3
+    RETRY_INTERVAL = 2
+    # 回数制限の回復を待つ時の最大間隔（秒）
+    MAX_RATE_WAIT = 60
+
+    def __init__(self, access_token, casings, project_id="", concurrency=4,
+                 rate_limit=2500, timeout=10, url=api.API_URL, proxies=None, log=None):
+        self._access_token = access_token
+        self._casings = list(casings)
+        self._project_id = project_id
+        self._concurrency = max(concurrency, 1)
+        self._timeout = timeout
+        self._url = url
+        self._limiter = RateLimiter(None, rate_limit)
+        self._client = KeepAliveClient(proxies, max_idle=self._concurrency, timeout=timeout)
+        self._log = log if log else (lambda message: print(message, file=sys.stderr))
+        # 同じ用語は1度だけ問い合わせる
+        self._translated = {}
+        self._requests = 0
+
+    # 出力する列名
+    def header(self):
+        return [
+            "{} ({})".format(casing, acronym_style) if acronym_style else (casing or "text")
+            for casing, acronym_style in self._casings]
+
+    # 入力ファイルを変換して出力ファイルに書き出す（今回変換した行数を返す）
+    def run(self, input_path, output_path, column=0, has_header=False,
+            delimiter=None, encoding="utf-8-sig", checkpoint_path=None):
+        delimiter = delimiter if delimiter else self._guess_delimiter(input_path)
+        checkpoint_path = checkpoint_path if checkpoint_path else output_path + ".checkpoint"
+        checkpoint = self._load_checkpoint(checkpoint_path, input_path, output_path)
+        done_rows = checkpoint['rows'] if checkpoint else 0
+
+        if checkpoint:
+            # チェックポイント以降に書かれた途中の行は捨てる
+            with open(output_path, "r+b") as file:
+                file.truncate(checkpoint['offset'])
+            self._log("Resuming from row {}".format(done_rows))
+
+        start = time.monotonic()
+        # 再開前に変換済みだった行は数えない
+        resumed_rows = done_rows
+        with open(input_path, "r", encoding=encoding, newline="") as input_file, \
+             open(output_path, "ab" if checkpoint else "wb") as output_binary, \
+             ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            output_file = io.TextIOWrapper(output_binary, encoding="utf-8", newline="")
+            reader = csv.reader(input_file, delimiter=delimiter)
+            writer = csv.writer(output_file, delimiter=delimiter)
+
+            header = next(reader, None) if has_header else None
+            if not checkpoint:
+                if header is not None:
+                    writer.writerow(header + self.header())
+                self._save_progress(output_file, checkpoint_path, input_path, output_path, 0)
+
+            rows = self._skip(reader, done_rows)
+            # 順番を保つため先に送ったものから書き出す（先読みは並列数の2倍まで）
+            pending = deque()
+            try:
+                for chunk in self._iter_chunks(rows, column):
+                    pending.append((chunk, executor.submit(self._translate_chunk, chunk, column)))
+                    if len(pending) >= self._concurrency * 2:
+                        done_rows += self._write_chunk(writer, column, *pending.popleft())
+                        self._save_progress(output_file, checkpoint_path, input_path, output_path, done_rows)
+                while pending:
+                    done_rows += self._write_chunk(writer, column, *pending.popleft())
+                    self._save_progress(output_file, checkpoint_path, input_path, output_path, done_rows)
+            except BaseException:
+                for _, future in pending:
+                    future.cancel()
+                raise
+            finally:
+                output_file.detach()
+
+        os.remove(checkpoint_path)
+        self._client.close()
+        written = done_rows - resumed_rows
+        self._log("Translated {} rows with {} requests in {:.1f}s".format(
+            written, self._requests, time.monotonic() - start))
+        return written
+
+    # 1回のリクエストで送る行をまとめる（用語が空の行は問い合わせない）
+    def _iter_chunks(self, rows, column):
+        chunk = []
+        texts = set()
+        for row in rows:
+            text = self._get_text(row, column)
+            if text and text not in self._translated and text not in texts:
+                if len(texts) >= self.MAX_TEXTS:
+                    yield chunk
+                    chunk = []
+                    texts = set()
+                texts.add(text)
+            chunk.append(row)
+        if chunk:
+            yield chunk
+
+    # まとめた行の未翻訳の用語を問い合わせる
+    def _translate_chunk(self, chunk, column):
+        texts = []
+        for row in chunk:
+            text = self._get_text(row, column)
+            if text and text not in self._translated and text not in texts:
+                texts.append(text)
+        if not texts:
+            return
+
+        query = api.Query("\n".join(texts), self._project_id, "", "")
+        values = api.parse_api_responses(self._open_api(api.build_api_request(query, self._access_token, self._url)))
+        # 足りない分を空のまま書き出すと、チェックポイントで変換済みになり再開しても問い合わせ直さない
+        if len(values) != len(texts):
+            raise ValueError("Unexpected number of results: {} (expected {})".format(len(values), len(texts)))
+        for text, value in zip(texts, values):
+            self._translated[text] = value
+
+    # 翻訳済みの行を書き出す（書き出した行数を返す）
+    def _write_chunk(self, writer, column, chunk, future):
+        future.result()
+        for row in chunk:
+            text = self._get_text(row, column)
+            value = self._translated.get(text) if text else None
+            if value:
+                result = value[0]
+                labels = [
+                    api.render_result(api.Query(text, self._project_id, casing, acronym_style), result).translated or ""
+                    for casing, acronym_style in self._casings]
+            else:
+                labels = [""] * len(self._casings)
+            writer.writerow(row + labels)
+        return len(chunk)
+
+    # 回数制限を守って問い合わせる（一時的な失敗は再試行する）
+    def _open_api(self, req):
+        for retry in range(self.RETRY_COUNT + 1):
+            while not self._limiter.try_acquire():
+                wait = min(max(self._limiter.retry_after(), 1), self.MAX_RATE_WAIT)
+                self._log("Request limit reached, waiting {:.0f}s".format(wait))
+                time.sleep(wait)
+
+            try:
+                self._requests += 1
+                response = self._client.open(req, timeout=self._timeout)
+                self._limiter.update_from_headers(response.headers)
+                return response.body
+            except urllib.error.HTTPError as exc:
+                self._limiter.update_from_headers(exc.headers)
+                if exc.code == 429:
+                    retry_after = exc.headers.get("Retry-After") if exc.headers else None
+                    self._limiter.exhaust(float(retry_after) if retry_after and retry_after.isdigit() else None)
+                    continue
+                if exc.code < 500 or retry >= self.RETRY_COUNT:
+                    raise
+            except OSError:
+                if retry >= self.RETRY_COUNT:
+                    raise
+            time.sleep(self.RETRY_INTERVAL * (retry + 1))
+        raise TimeoutError("Request limit was not restored")
+
+    # 書き出した分を確定してチェックポイントを保存する
+    def _save_progress(self, output_file, checkpoint_path, input_path, output_path, rows):
+        output_file.flush()
+        output_file.buffer.flush()
+        os.fsync(output_file.buffer.fileno())
+        data = {
+            'input': os.path.abspath(input_path),
+            'output': os.path.abspath(output_path),
+            'rows': rows,
+            'offset': output_file.buffer.tell()
+        }
+        save_json(checkpoint_path, data, self.FORMAT_VERSION)
+
+    # 同じ入出力のチェックポイントを読み込む（ない場合はNone）
+    def _load_checkpoint(self, checkpoint_path, input_path, output_path):
+        if not os.path.isfile(output_path):
+            return None
+
+        data = load_json(checkpoint_path, self.FORMAT_VERSION)
+        if data is None:
+            return None
+        if data['input'] != os.path.abspath(input_path) or data['output'] != os.path.abspath(output_path):
+            raise ValueError("Checkpoint {} belongs to another file".format(checkpoint_path))
+        return data
+
+    # 変換済みの行を読み飛ばす
+    @staticmethod
+    def _skip(reader, count):
+        for _ in range(count):
+            if next(reader, None) is None:
+                break
+        return reader
+
+    # 行から用語を取り出す（1行で問い合わせるため改行は空白にする）
+    def _get_text(self, row, column):
+        if column >= len(row):
+            return ""
+        return canonicalize(row[column].replace("\r", " ").replace("\n", " "))
+
+    @staticmethod
+    def _guess_delimiter(path):
+        return "\t" if os.path.splitext(path)[1].lower() in {".tsv", ".tab", ".txt"} else ","
+
+# 出力するケースを解析する（all は全てのケースと頭字語の書き方）
+def parse_casings(values):
+    casings = []
+    for value in values if values else ["all"]:
+        value = value.strip().lower()
+        if value == "all":
+            casings.append(("", ""))
+            casings.extend(api.iter_casings())
+            continue
+
+        casing, _, acronym_style = value.partition("/")
+        if casing not in api.CASING_DICT and casing not in {"", "none"}:
+            raise ValueError("Unknown casing: {}".format(value))
+        if acronym_style and acronym_style not in api.ACRONYM_STYLE_DICT:
+            raise ValueError("Unknown acronym style: {}".format(value))
+        casing = "" if casing == "none" else casing
+        casings.append((casing, acronym_style if casing in api.ACRONYM_CASINGS else ""))
+
+    # 重複は除く（順番は保つ）
+    return list(dict.fromkeys(casings))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m lib.bulk",
+        description="Translate a Japanese glossary (CSV/TSV) into identifiers with the Codic API.")
+    parser.add_argument("input", help="glossary file (.csv, or .tsv/.txt for tab separated)")
+    parser.add_argument("output", help="output file; the input columns followed by one column per casing")
+    parser.add_argument("--token", default=os.environ.get("CODIC_ACCESS_TOKEN", ""),
+                        help="access token (default: CODIC_ACCESS_TOKEN environment variable)")
+    parser.add_argument("--column", type=int, default=0, help="0-based column of the Japanese term (default: 0)")
+    parser.add_argument("--header", action="store_true", help="the first row is a header")
+    parser.add_argument("--delimiter", help="field delimiter (default: guessed from the input extension)")
+    parser.add_argument("--encoding", default="utf-8-sig", help="input encoding (default: utf-8-sig)")
+    parser.add_argument("--project-id", default="", help="user project dictionary to use")
+    parser.add_argument("--casing", action="append",
+                        help="casing to output, e.g. camel, pascal/literal, none or all (repeatable, default: all)")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent requests (default: 4)")
+    parser.add_argument("--rate-limit", type=int, default=2500, help="requests per hour, 0 to disable (default: 2500)")
+    parser.add_argument("--timeout", type=float, default=10, help="request timeout in seconds (default: 10)")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: OUTPUT.checkpoint)")
+    args = parser.parse_args(argv)
+
+    if not args.token:
+        parser.error("access token is required (--token or CODIC_ACCESS_TOKEN)")
+    try:
+        casings = parse_casings(args.casing)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    translator = BulkTranslator(
+        args.token,
+        casings,
+        project_id=args.project_id,
+        concurrency=args.concurrency,
+        rate_limit=args.rate_limit,
+        timeout=args.timeout,
+        proxies=urllib.request.getproxies())
+    try:
+        translator.run(
+            args.input,
+            args.output,
+            column=args.column,
+            has_header=args.header,
+            delimiter=args.delimiter,
+            encoding=args.encoding,
+            checkpoint_path=args.checkpoint)
+    except KeyboardInterrupt:
+        print("Interrupted. Run the same command again to resume.", file=sys.stderr)
+        return 130
+    except (OSError, ValueError) as exc:
+        print("Error: {}. Run the same command again to resume.".format(exc), file=sys.stderr)
+        return 1
+    return 0
+
+# python -m lib.bulk INPUT OUTPUT [options]
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+import threading
+import time
+from .store import load_json, save_json
+
+class TranslationCache:
+    """
+    翻訳結果の永続キャッシュ
+
+    LRU順に保持し、件数上限を超えた場合は最も使われていないものから破棄する。
+    TTL(秒)が0より大きい場合は期限切れのものを取得時に破棄する。
+    値はメモリ上ではそのまま保持し、保存時のみencode/decodeで変換する。
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, max_entries=1000, ttl=0, encode=None, decode=None):
+        self._path = path
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._encode = encode if encode else (lambda value: value)
+        self._decode = decode if decode else (lambda value: value)
+        # key -> (登録時刻, 値)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    # 上限を変更する
+    def configure(self, max_entries, ttl):
+        with self._lock:
+            self._max_entries = max_entries
+            self._ttl = ttl
+            self._evict()
+
+    # キャッシュから取得（なければNone）
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_expired(entry[0], time.time()):
+                del self._entries[key]
+                self._dirty = True
+                return None
+            self._entries.move_to_end(key)
+            self._dirty = True
+            return entry[1]
+
+    # LRUの順序を変えずに取得（なければNone）
+    def peek(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry[0], time.time()):
+                return None
+            return entry[1]
+
+    # 全ての (キー, 値) のリスト
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, (_, value) in self._entries.items()]
+
+    # キャッシュに登録
+    def put(self, key, value):
+        if self._max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            self._dirty = True
+            self._evict()
+
+    # 条件に一致するものを破棄
+    def invalidate(self, predicate=None):
+        with self._lock:
+            keys = [key for key in self._entries if predicate is None or predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            if keys:
+                self._dirty = True
+            return len(keys)
+
+    # ファイルから読み込む
+    def load(self):
+        data = load_json(self._path, self.FORMAT_VERSION)
+        if data is None:
+            return 0
+
+        now = time.time()
+        with self._lock:
+            self._entries.clear()
+            for key, timestamp, value in data.get('entries', []):
+                if self._is_expired(timestamp, now):
+                    continue
+                self._entries[tuple(key)] = (timestamp, self._decode(value))
+            self._evict()
+            self._dirty = False
+            return len(self._entries)
+
+    # 変更があればファイルに保存する
+    def save(self):
+        if not self._path:
+            return False
+
+        with self._lock:
+            if not self._dirty:
+                return False
+            entries = [
+                [list(key), timestamp, self._encode(value)]
+                for key, (timestamp, value) in self._entries.items()]
+            self._dirty = False
+
+        save_json(self._path, {'entries': entries}, self.FORMAT_VERSION)
+        return True
+
+    def _is_expired(self, timestamp, now):
+        return self._ttl > 0 and now - timestamp > self._ttl
+
+    def _evict(self):
+        while len(self._entries) > max(self._max_entries, 0):
+            self._entries.popitem(last=False)
+            self._dirty = True
@@ -0,0 +1,35 @@
+import re
+import unicodedata
+
+# 末尾から取り除く句読点・記号
+TRAILING_PUNCTUATION = set("。、，．,.!?！？・…:;：；")
+# 末尾から取り除く助詞（翻訳結果に現れないもの）
+TRAILING_PARTICLES = ("を", "は", "が")
+# 助詞を取り除くのは漢字・カタカナ・英数字の後だけ（「はは」「しょうが」等のひらがなの語は残す）
+PARTICLE_BASE = re.compile(r"[\u3005\u3400-\u4dbf\u4e00-\u9fff\u30a1-\u30ffA-Za-z0-9]")
+
+# 翻訳結果が変わらない表記の揺れを揃える
+#   * NFKC正規化（全角英数・半角カナ・全角スペース等）
+#   * 連続する空白を1つにまとめ、前後の空白を除く
+#   * 末尾の句読点と、漢字・カタカナ・英数字に続く末尾の助詞を除く
+# 改行は行の区切りとして残す
+def canonicalize(text):
+    if not text:
+        return ""
+    return "\n".join(filter(None, (_canonicalize_line(line) for line in text.splitlines())))
+
+def _canonicalize_line(line):
+    line = " ".join(unicodedata.normalize("NFKC", line).split())
+
+    while line:
+        stripped = line.rstrip("".join(TRAILING_PUNCTUATION)).rstrip()
+        for particle in TRAILING_PARTICLES:
+            base = stripped[:-len(particle)].rstrip()
+            if stripped.endswith(particle) and base and PARTICLE_BASE.match(base[-1]):
+                stripped = base
+                break
+        if not stripped or stripped == line:
+            break
+        line = stripped
+
+    return line
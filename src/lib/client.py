@@ -0,0 +1,207 @@
+from collections import namedtuple
+import base64
+import http.client
+import io
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+class KeepAliveClient:
+    """
+    HTTP/1.1 keep-alive で接続を使い回すクライアント
+
+    接続は(scheme, host, port)毎にプールし、レスポンスを読み終えたら返却する。
+    max_idle_time 秒以上使われていない接続はサーバーに閉じられている可能性が高いので破棄する。
+    それでもアイドル接続を閉じられていた場合は新しい接続で1度だけやり直す。
+    プロキシは urllib.request.getproxies() と同じ形式の辞書で渡す。
+    observe を渡すと接続（connect）と応答待ち（server）の秒数を observe(phase, seconds) で通知する。
+    """
+
+    Response = namedtuple('Response', ('status', 'headers', 'body'))
+
+    # 使い回した接続が切れていた時に発生する例外
+    RECONNECT_ERRORS = (
+        http.client.RemoteDisconnected,
+        http.client.CannotSendRequest,
+        http.client.BadStatusLine,
+        ConnectionResetError,
+        ConnectionAbortedError,
+        BrokenPipeError)
+
+    def __init__(self, proxies=None, max_idle=4, timeout=None, ssl_context=None, observe=None, max_idle_time=15):
+        self._proxies = dict(proxies) if proxies else {}
+        self._observe = observe
+        self._max_idle = max_idle
+        self._max_idle_time = max_idle_time
+        self._timeout = timeout
+        self._ssl_context = ssl_context if ssl_context else ssl.create_default_context()
+        # (scheme, host, port) -> アイドル状態の (接続, 返却時刻) のリスト
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    # リクエストを送信してレスポンスを読み込む
+    def open(self, request, timeout=None):
+        url = urllib.parse.urlsplit(request.full_url)
+        key = (url.scheme, url.hostname, url.port or self._default_port(url.scheme))
+        path = urllib.parse.urlunsplit(('', '', url.path or '/', url.query, ''))
+        headers = dict(request.header_items())
+        body = request.data
+        method = request.get_method()
+
+        conn, reused = self._acquire(key)
+        try:
+            try:
+                response = self._request(conn, key, method, path, body, headers, timeout)
+            except self.RECONNECT_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                # アイドル中に切断されていたので新しい接続でやり直す
+                conn = self._connect(key)
+                response = self._request(conn, key, method, path, body, headers, timeout)
+        except BaseException:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+        if not 200 <= response.status < 300:
+            raise urllib.error.HTTPError(
+                request.full_url, response.status, response.reason,
+                response.msg, io.BytesIO(response.data))
+
+        return self.Response(response.status, response.msg, response.data)
+
+    # 接続だけ先に確立しておく（使えるアイドル接続があれば何もしない）
+    def preconnect(self, url, timeout=None):
+        url = urllib.parse.urlsplit(url)
+        key = (url.scheme, url.hostname, url.port or self._default_port(url.scheme))
+
+        with self._lock:
+            expired = self._expire(key)
+            has_idle = bool(self._idle.get(key))
+        for conn in expired:
+            conn.close()
+        if has_idle:
+            return False
+
+        conn = self._connect(key)
+        if timeout is not None:
+            conn.timeout = timeout
+        start = time.monotonic()
+        conn.connect()
+        self._notify("connect", time.monotonic() - start)
+        self._release(key, conn)
+        return True
+
+    # 全ての接続を閉じる
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+    def _request(self, conn, key, method, path, body, headers, timeout):
+        if timeout is not None:
+            conn.timeout = timeout
+            if conn.sock:
+                conn.sock.settimeout(timeout)
+
+        # HTTPプロキシ経由の場合は絶対URLで送る
+        if key[0] == "http" and self._get_proxy(key[0]):
+            path = "http://{}:{}{}".format(key[1], key[2], path)
+            headers = dict(headers, **self._get_proxy_headers(key[0]))
+
+        if conn.sock is None:
+            start = time.monotonic()
+            conn.connect()
+            self._notify("connect", time.monotonic() - start)
+
+        start = time.monotonic()
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.data = response.read()
+        self._notify("server", time.monotonic() - start)
+        return response
+
+    def _notify(self, phase, seconds):
+        if self._observe:
+            self._observe(phase, seconds)
+
+    def _acquire(self, key):
+        with self._lock:
+            expired = self._expire(key)
+            conns = self._idle.get(key)
+            conn = conns.pop()[0] if conns else None
+        for old in expired:
+            old.close()
+        if conn:
+            return conn, True
+        return self._connect(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if self._closed or len(conns) >= self._max_idle:
+                conn.close()
+            else:
+                conns.append((conn, time.monotonic()))
+
+    # 長く使われていない接続をプールから外して返す（ロック中に呼ぶ、閉じるのは呼び出し元）
+    def _expire(self, key):
+        conns = self._idle.get(key)
+        if not conns or self._max_idle_time is None:
+            return []
+        deadline = time.monotonic() - self._max_idle_time
+        # 古い順に並んでいる
+        count = 0
+        while count < len(conns) and conns[count][1] < deadline:
+            count += 1
+        expired = [conn for conn, _ in conns[:count]]
+        del conns[:count]
+        return expired
+
+    def _connect(self, key):
+        scheme, host, port = key
+        proxy = self._get_proxy(scheme)
+
+        if not proxy:
+            if scheme == "https":
+                return http.client.HTTPSConnection(host, port, timeout=self._timeout, context=self._ssl_context)
+            return http.client.HTTPConnection(host, port, timeout=self._timeout)
+
+        proxy = self._split_proxy(proxy)
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(
+                proxy.hostname, proxy.port or 8080, timeout=self._timeout, context=self._ssl_context)
+            conn.set_tunnel(host, port, headers=self._get_proxy_headers(scheme))
+            return conn
+        return http.client.HTTPConnection(proxy.hostname, proxy.port or 8080, timeout=self._timeout)
+
+    def _get_proxy(self, scheme):
+        return self._proxies.get(scheme)
+
+    # プロキシ認証用のヘッダー
+    def _get_proxy_headers(self, scheme):
+        proxy = self._split_proxy(self._get_proxy(scheme))
+        if not proxy.username:
+            return {}
+        credentials = "{}:{}".format(
+            urllib.parse.unquote(proxy.username), urllib.parse.unquote(proxy.password or ""))
+        return {'Proxy-Authorization': "Basic " + base64.b64encode(credentials.encode()).decode()}
+
+    @staticmethod
+    def _split_proxy(proxy):
+        return urllib.parse.urlsplit(proxy if "://" in proxy else "http://" + proxy)
+
+    @staticmethod
+    def _default_port(scheme):
+        return 443 if scheme == "https" else 80
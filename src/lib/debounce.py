@@ -0,0 +1,104 @@
+from collections import deque
+import threading
+import time
+
+class AdaptiveDebouncer:
+    """
+    入力間隔と通信時間から問い合わせ前の待ち時間を決める
+
+    キー入力の間隔は指数移動平均で学習する。学習するのは直前の入力の待ち時間を
+    打ち切った間隔だけで、待ち終えた後（結果を見てから）の入力は打ち始めとみなす。
+    待ち時間や通信時間を含む間隔を学習すると、待ち時間が自分を元に伸び続けるため。
+    待ち時間は次のキー入力が来そうな間隔を基準に、
+    連続して入力中なら長く、長い入力なら短くし、[min_wait, max_wait] に収める。
+    """
+
+    # 平均に反映する割合
+    SMOOTHING = 0.3
+    # これ以上間隔が空いたら打ち始めとみなす（秒）
+    SESSION_GAP = 1.5
+    # 学習済みとみなす入力回数（それまでは initial_wait を使う）
+    MIN_SAMPLES = 3
+    # 入力間隔に対する待ち時間の倍率
+    TYPING_FACTOR = 1.5
+    # 連続入力中とみなす回数と倍率
+    BURST_COUNT = 4
+    BURST_FACTOR = 1.3
+    # 長い入力とみなす文字数と倍率
+    LONG_INPUT = 8
+    LONG_INPUT_FACTOR = 0.7
+    # 通信が入力間隔より遅い時の倍率（届く前に次の入力で無駄になりやすい）
+    SLOW_API_FACTOR = 1.2
+
+    def __init__(self, min_wait=0.1, max_wait=3.0, initial_wait=0.3):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.initial_wait = initial_wait
+        self._interval = None
+        self._samples = 0
+        self._burst = 0
+        self._last_input = None
+        # 直前の入力で選んだ待ち時間（待たなかった場合はNone）
+        self._last_wait = None
+        self._latencies = deque(maxlen=50)
+        self._lock = threading.Lock()
+
+    # キー入力を記録する
+    def record_input(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._last_input is not None:
+                interval = now - self._last_input
+                if self._last_wait is not None and interval < min(self._last_wait, self.SESSION_GAP):
+                    if self._interval is None:
+                        self._interval = interval
+                    else:
+                        self._interval += self.SMOOTHING * (interval - self._interval)
+                    self._samples += 1
+                    self._burst += 1
+                else:
+                    self._burst = 0
+            self._last_input = now
+            self._last_wait = None
+
+    # 通信時間を記録する
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    # 通信時間の中央値（記録がなければNone）
+    def latency(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        return latencies[len(latencies) // 2] if latencies else None
+
+    # 入力間隔の平均（学習前はNone）
+    def interval(self):
+        with self._lock:
+            return self._interval if self._samples >= self.MIN_SAMPLES else None
+
+    # 待ち時間を決める（次の入力がこれより早ければ入力間隔として学習する）
+    def wait_time(self, text_length):
+        wait = self._compute_wait(text_length)
+        with self._lock:
+            self._last_wait = wait
+        return wait
+
+    def _compute_wait(self, text_length):
+        interval = self.interval()
+        if interval is None:
+            return self.initial_wait
+
+        wait = interval * self.TYPING_FACTOR
+        with self._lock:
+            burst = self._burst
+        if burst >= self.BURST_COUNT:
+            wait *= self.BURST_FACTOR
+        if text_length >= self.LONG_INPUT:
+            wait *= self.LONG_INPUT_FACTOR
+
+        latency = self.latency()
+        if latency is not None and latency > interval:
+            wait *= self.SLOW_API_FACTOR
+
+        return min(max(wait, self.min_wait), self.max_wait)
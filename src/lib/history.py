@@ -0,0 +1,170 @@
+import bisect
+import threading
+import time
+from .store import load_json, save_json
+
+class History:
+    """
+    コピーされた識別子の履歴
+
+    (入力, 識別子, ケース) 毎の使用回数と最終使用時刻、
+    単語毎に選ばれた訳語の回数を記録する。
+    入力の前方一致（ソート済みリストの二分探索）と、あいまい一致（部分列）で検索する。
+    件数が上限を超えた場合は最終使用時刻の古いものから破棄する。
+    """
+
+    FORMAT_VERSION = 1
+    # 一致の種類毎の重み
+    PREFIX_WEIGHT = 2.0
+    FUZZY_WEIGHT = 1.0
+
+    def __init__(self, path, max_entries=2000):
+        self._path = path
+        self._max_entries = max_entries
+        # (入力, 識別子, ケース) -> [回数, 最終使用時刻]
+        self._entries = {}
+        # ソート済みの入力の一覧
+        self._texts = []
+        # 入力 -> その入力の履歴のキー
+        self._keys_by_text = {}
+        # (単語, 訳語) -> 回数
+        self._choices = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    # 使用した識別子を記録する（複数行の入力は記録しない）
+    def record(self, text, identifier, casing, choices=()):
+        if not text or not identifier or "\n" in text:
+            return
+
+        key = (text, identifier, casing)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._add(key, 1, time.time())
+            else:
+                entry[0] += 1
+                entry[1] = time.time()
+            for choice in choices:
+                self._choices[choice] = self._choices.get(choice, 0) + 1
+            self._evict()
+            self._dirty = True
+
+    # 単語の訳語が選ばれた回数
+    def choice_count(self, word_text, candidate):
+        return self._choices.get((word_text, candidate), 0)
+
+    # 入力に一致する履歴を (入力, 識別子, ケース) のリストで順位順に返す
+    def search(self, text, casing, limit=3):
+        if not text or limit <= 0:
+            return []
+
+        with self._lock:
+            scores = {}
+            # 前方一致
+            start = bisect.bisect_left(self._texts, text)
+            for i in range(start, len(self._texts)):
+                if not self._texts[i].startswith(text):
+                    break
+                self._score(scores, self._texts[i], casing, self.PREFIX_WEIGHT)
+            # あいまい一致
+            for history_text in self._texts:
+                if not history_text.startswith(text) and self._is_subsequence(text, history_text):
+                    self._score(scores, history_text, casing, self.FUZZY_WEIGHT)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [key for key, _ in ranked[:limit]]
+
+    # 入力で始まる履歴の入力を、ケースに関係なく使用回数の多い順に返す（入力自体は除く）
+    def continuations(self, text, limit=3):
+        if not text or limit <= 0:
+            return []
+
+        with self._lock:
+            counts = {}
+            start = bisect.bisect_left(self._texts, text)
+            for i in range(start, len(self._texts)):
+                history_text = self._texts[i]
+                if not history_text.startswith(text):
+                    break
+                if history_text != text:
+                    counts[history_text] = sum(self._entries[key][0] for key in self._keys_by_text[history_text])
+
+        ranked = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+        return [history_text for history_text, _ in ranked[:limit]]
+
+    # ファイルから読み込む
+    def load(self):
+        data = load_json(self._path, self.FORMAT_VERSION)
+        if data is None:
+            return 0
+
+        with self._lock:
+            self._entries.clear()
+            self._texts.clear()
+            self._keys_by_text.clear()
+            for text, identifier, casing, count, last_used in data.get('entries', []):
+                if "\n" in text:
+                    continue
+                self._add((text, identifier, casing), count, last_used)
+            self._choices = {
+                (word_text, candidate): count
+                for word_text, candidate, count in data.get('choices', [])}
+            self._evict()
+            self._dirty = False
+            return len(self._entries)
+
+    # 変更があればファイルに保存する
+    def save(self):
+        if not self._path:
+            return False
+
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {
+                'entries': [list(key) + entry for key, entry in self._entries.items()],
+                'choices': [list(key) + [count] for key, count in self._choices.items()]
+            }
+            self._dirty = False
+
+        save_json(self._path, data, self.FORMAT_VERSION)
+        return True
+
+    def _add(self, key, count, last_used):
+        self._entries[key] = [count, last_used]
+        keys = self._keys_by_text.setdefault(key[0], [])
+        if not keys:
+            bisect.insort(self._texts, key[0])
+        keys.append(key)
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._keys_by_text[key[0]]
+        keys.remove(key)
+        if not keys:
+            del self._keys_by_text[key[0]]
+            del self._texts[bisect.bisect_left(self._texts, key[0])]
+
+    def _evict(self):
+        if len(self._entries) <= self._max_entries:
+            return
+        keys = sorted(self._entries, key=lambda key: self._entries[key][1])
+        for key in keys[:len(self._entries) - self._max_entries]:
+            self._remove(key)
+
+    def _score(self, scores, text, casing, weight):
+        for key in self._keys_by_text[text]:
+            if key[2] != casing:
+                continue
+            count, last_used = self._entries[key]
+            # 回数が同じなら最近使ったものを上にする
+            scores[key] = max(scores.get(key, 0), weight * count + last_used * 1e-12)
+
+    @staticmethod
+    def _is_subsequence(text, target):
+        it = iter(target)
+        return all(char in it for char in text)
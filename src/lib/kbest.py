@@ -0,0 +1,31 @@
+import heapq
+import itertools
+
+# 各位置の候補のコストのリストから、合計コストが小さい組み合わせ順に
+# (合計コスト, 各位置で選んだ候補の番号のタプル) を返すジェネレータ
+#
+# 直積は作らず、優先度付きキューで次に小さいものだけを求める。
+# 同じ組み合わせを2度作らないように、最後に進めた位置以降の位置だけを進める。
+def iter_best(costs):
+    if not costs or not all(costs):
+        return
+
+    # 位置毎にコストの小さい順に並べた候補の番号
+    orders = [sorted(range(len(position)), key=position.__getitem__) for position in costs]
+
+    def _cost(ranks):
+        return sum(costs[i][orders[i][rank]] for i, rank in enumerate(ranks))
+
+    start = (0,) * len(costs)
+    # 同じコストの時の比較用の通し番号
+    counter = itertools.count()
+    heap = [(_cost(start), next(counter), start, 0)]
+
+    while heap:
+        cost, _, ranks, last = heapq.heappop(heap)
+        yield cost, tuple(orders[i][rank] for i, rank in enumerate(ranks))
+
+        for i in range(last, len(ranks)):
+            if ranks[i] + 1 < len(orders[i]):
+                next_ranks = ranks[:i] + (ranks[i] + 1,) + ranks[i + 1:]
+                heapq.heappush(heap, (_cost(next_ranks), next(counter), next_ranks, i))
@@ -0,0 +1,134 @@
+import threading
+from .store import load_json, save_json
+
+class Lexicon:
+    """
+    APIの結果から学習した日本語の単語と訳語候補の辞書
+
+    単語はトライ木で索引し、入力を先頭から最長一致で分割する。
+    訳語が空のリストの単語は、翻訳時に無視される語（「を」等）を表す。
+    """
+
+    FORMAT_VERSION = 1
+    # トライ木で単語の終端を表すキー
+    _TERMINAL = ""
+
+    def __init__(self, path, max_entries=50000):
+        self._path = path
+        self._max_entries = max_entries
+        # 単語 -> 訳語候補
+        self._entries = {}
+        self._trie = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, text):
+        return text in self._entries
+
+    # 単語の訳語候補（なければNone）
+    def get(self, text):
+        return self._entries.get(text)
+
+    # 翻訳結果の単語を登録する
+    def learn(self, text, words):
+        with self._lock:
+            pos = 0
+            for word_text, successful, candidates in words:
+                found = text.find(word_text, pos)
+                if found < 0:
+                    continue
+                # 結果に含まれなかった部分は無視される語
+                self._add_ignorable(text[pos:found])
+                if successful:
+                    self._add(word_text, tuple([candidate for candidate in candidates if candidate]))
+                pos = found + len(word_text)
+            self._add_ignorable(text[pos:])
+
+    # 単語の訳語候補を登録（置き換え）する
+    def update(self, text, candidates):
+        with self._lock:
+            self._add(text.strip(), tuple(candidates))
+
+    # 最長一致で分割して (文字列, 訳語候補またはNone) のリストを返す
+    def segment(self, text):
+        segments = []
+        unknown_start = None
+        pos = 0
+        while pos < len(text):
+            end = self._match(text, pos)
+            if end is None:
+                if unknown_start is None:
+                    unknown_start = pos
+                pos += 1
+                continue
+
+            if unknown_start is not None:
+                segments.append((text[unknown_start:pos], None))
+                unknown_start = None
+            segments.append((text[pos:end], self._entries[text[pos:end]]))
+            pos = end
+
+        if unknown_start is not None:
+            segments.append((text[unknown_start:], None))
+        return segments
+
+    # ファイルから読み込む
+    def load(self):
+        data = load_json(self._path, self.FORMAT_VERSION)
+        if data is None:
+            return 0
+
+        with self._lock:
+            self._entries.clear()
+            self._trie.clear()
+            for text, candidates in data.get('entries', {}).items():
+                self._add(text, tuple(candidates))
+            self._dirty = False
+            return len(self._entries)
+
+    # 変更があればファイルに保存する
+    def save(self):
+        if not self._path:
+            return False
+
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {'entries': dict(self._entries)}
+            self._dirty = False
+
+        save_json(self._path, data, self.FORMAT_VERSION)
+        return True
+
+    def _add_ignorable(self, text):
+        text = text.strip()
+        if text and text not in self._entries:
+            self._add(text, ())
+
+    def _add(self, text, candidates):
+        if not text or (text not in self._entries and len(self._entries) >= self._max_entries):
+            return
+        if self._entries.get(text) == candidates:
+            return
+
+        self._entries[text] = candidates
+        node = self._trie
+        for char in text:
+            node = node.setdefault(char, {})
+        node[self._TERMINAL] = True
+        self._dirty = True
+
+    # pos から始まる最長の単語の終端位置（なければNone）
+    def _match(self, text, pos):
+        node = self._trie
+        end = None
+        for i in range(pos, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if self._TERMINAL in node:
+                end = i + 1
+        return end
@@ -0,0 +1,82 @@
+from collections import OrderedDict, deque
+import threading
+
+class Prefetcher:
+    """
+    次に使われそうなキーを裏で先に取得しておくワーカー
+
+    submit(keys) した依頼を最大 max_workers 個のスレッドで fetch(keys, cancelled) に渡す。
+    待っている依頼は新しいものから max_pending 件までで、古いものは捨てる。
+    cancel() で待っている依頼を全て捨て、実行中の依頼は cancelled() が True になる。
+    fetch は取得したキーを返し、それが後で使われたか（consume）で的中率を数えられる。
+    スレッドは依頼がある間だけ動き、なくなれば終了する。
+    """
+
+    # 使われるのを待つキーの上限（古いものから忘れる）
+    MAX_FETCHED = 1000
+
+    def __init__(self, fetch, max_workers=1, max_pending=2):
+        self._fetch = fetch
+        self._max_workers = max_workers
+        # (世代, キーのタプル)
+        self._pending = deque(maxlen=max_pending)
+        self._workers = 0
+        self._generation = 0
+        # 取得してまだ使われていないキー
+        self._fetched = OrderedDict()
+        self._lock = threading.Lock()
+
+    # 依頼を追加する
+    def submit(self, keys):
+        keys = tuple(keys)
+        if not keys:
+            return
+
+        with self._lock:
+            self._pending.append((self._generation, keys))
+            if self._workers >= self._max_workers:
+                return
+            self._workers += 1
+
+        thread = threading.Thread(target=self._run, name="codic-prefetch", daemon=True)
+        thread.start()
+
+    # 待っている依頼を捨て、実行中の依頼を取り消す
+    def cancel(self):
+        with self._lock:
+            self._generation += 1
+            self._pending.clear()
+
+    # 先に取得したキーなら True を返す（1回だけ数える）
+    def consume(self, key):
+        with self._lock:
+            return self._fetched.pop(key, None) is not None
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        self._workers -= 1
+                        return
+                    # 新しい入力の依頼から処理する
+                    generation, keys = self._pending.pop()
+
+                def cancelled(generation=generation):
+                    return generation != self._generation
+
+                if cancelled():
+                    continue
+                fetched = self._fetch(keys, cancelled)
+
+                with self._lock:
+                    for key in fetched:
+                        self._fetched[key] = True
+                        self._fetched.move_to_end(key)
+                    while len(self._fetched) > self.MAX_FETCHED:
+                        self._fetched.popitem(last=False)
+        except BaseException:
+            # fetch が失敗してもスレッドの数は戻す
+            with self._lock:
+                self._workers -= 1
+            raise
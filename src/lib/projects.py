@@ -0,0 +1,98 @@
+import os
+import threading
+
+from .lexicon import Lexicon
+from .store import load_json, save_json
+
+class ProjectMirror:
+    """
+    Codicのプロジェクト（チーム辞書）の登録語のローカルコピー
+
+    プロジェクト毎に Lexicon として保存し、最後に取得した更新日時以降の
+    登録語だけを差分で取得する。登録語の取得は fetch(project_id, offset, count, since)
+    に任せ、(日本語, 訳語, 更新日時) のリストを返してもらう。
+    """
+
+    PAGE_SIZE = 100
+    STATE_FILE_NAME = "projects.json"
+
+    def __init__(self, directory, fetch):
+        self._directory = directory
+        self._fetch = fetch
+        # project_id -> Lexicon
+        self._projects = {}
+        # project_id -> 取得済みの最新の更新日時
+        self._synced = {}
+        self._lock = threading.Lock()
+
+    # プロジェクトの登録語の訳語（なければNone）
+    def lookup(self, project_id, text):
+        project = self._projects.get(project_id)
+        if project is None:
+            return None
+        return project.get(text) or None
+
+    # 対象のプロジェクトを読み込む（対象外になったものは破棄する）
+    def load(self, project_ids):
+        self._load_state()
+
+        with self._lock:
+            for project_id in list(self._projects):
+                if project_id not in project_ids:
+                    del self._projects[project_id]
+
+            for project_id in project_ids:
+                if project_id in self._projects:
+                    continue
+                project = Lexicon(self._get_path(project_id))
+                project.load()
+                self._projects[project_id] = project
+
+    def project_ids(self):
+        return list(self._projects)
+
+    # 前回以降に更新された登録語を取得する
+    def sync(self, project_id):
+        project = self._projects.get(project_id)
+        if project is None:
+            return 0
+
+        since = self._synced.get(project_id)
+        latest = since
+        count = 0
+        offset = 0
+        while True:
+            entries = self._fetch(project_id, offset, self.PAGE_SIZE, since)
+            for text, translated, updated_at in entries:
+                project.update(text, [translated])
+                if updated_at and (latest is None or updated_at > latest):
+                    latest = updated_at
+            count += len(entries)
+            offset += len(entries)
+            if len(entries) < self.PAGE_SIZE:
+                break
+
+        with self._lock:
+            if latest:
+                self._synced[project_id] = latest
+        return count
+
+    # 変更があればファイルに保存する
+    def save(self):
+        for project in list(self._projects.values()):
+            project.save()
+
+        with self._lock:
+            state = dict(self._synced)
+        save_json(os.path.join(self._directory, self.STATE_FILE_NAME), state)
+
+    def _load_state(self):
+        state = load_json(os.path.join(self._directory, self.STATE_FILE_NAME))
+        if state is None:
+            return
+        with self._lock:
+            self._synced = {key: value for key, value in state.items() if value}
+
+    def _get_path(self, project_id):
+        name = "".join(char if char.isalnum() else "_" for char in str(project_id))
+        return os.path.join(self._directory, "project_{}.json".format(name))
@@ -0,0 +1,162 @@
+import threading
+import time
+from .store import load_json, save_json
+
+class RateLimitExceeded(Exception):
+    """
+    回数制限に達したため問い合わせなかったことを表す例外
+    """
+
+    def __init__(self, retry_after=None):
+        super().__init__("Request limit exceeded{}".format(
+            " (retry after {:.0f}s)".format(retry_after) if retry_after else ""))
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """
+    1時間あたりのリクエスト数を制限するトークンバケット
+
+    limit 件を上限に1時間かけて回復する。サーバーから返された
+    X-RateLimit-* ヘッダーがあればそちらの残数と回復時刻を優先する。
+    状態はファイルに保存し、再起動後も使用済みの回数を引き継ぐ。
+    limit が0の場合は制限しない。
+    """
+
+    PERIOD = 60 * 60
+    FORMAT_VERSION = 1
+
+    HEADER_LIMIT = "X-RateLimit-Limit"
+    HEADER_REMAINING = "X-RateLimit-Remaining"
+    HEADER_RESET = "X-RateLimit-Reset"
+
+    def __init__(self, path, limit=2500):
+        self._path = path
+        self._limit = limit
+        self._tokens = float(limit)
+        self._updated = time.time()
+        # この時刻までは問い合わせない（サーバーから制限された場合）
+        self._blocked_until = 0
+        self._used = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    # 上限を変更する
+    def configure(self, limit):
+        with self._lock:
+            self._refill(time.time())
+            self._limit = limit
+            self._tokens = min(self._tokens, float(limit))
+
+    # 1回分消費する（reserve 件は残しておく）
+    def try_acquire(self, reserve=0):
+        if self._limit <= 0:
+            return True
+
+        now = time.time()
+        with self._lock:
+            self._refill(now)
+            if now < self._blocked_until:
+                return False
+            if self._tokens - 1 < reserve:
+                return False
+            self._tokens -= 1
+            self._used += 1
+            self._dirty = True
+            return True
+
+    # 消費できなかった時に回復までの秒数
+    def retry_after(self):
+        now = time.time()
+        with self._lock:
+            self._refill(now)
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            if self._limit <= 0 or self._tokens >= 1:
+                return 0
+            return (1 - self._tokens) * self.PERIOD / self._limit
+
+    # 残り回数（制限なしはNone）
+    def remaining(self):
+        if self._limit <= 0:
+            return None
+        with self._lock:
+            self._refill(time.time())
+            return int(self._tokens)
+
+    # 起動後に消費した回数
+    def used(self):
+        return self._used
+
+    # レスポンスヘッダーの制限情報を反映する
+    def update_from_headers(self, headers):
+        if not headers:
+            return
+
+        remaining = self._get_number(headers, self.HEADER_REMAINING)
+        reset = self._get_number(headers, self.HEADER_RESET)
+        if remaining is None:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._refill(now)
+            self._tokens = min(self._tokens, remaining)
+            if remaining <= 0 and reset:
+                # Unix時刻または残り秒数のどちらでも受け付ける
+                self._blocked_until = reset if reset > now / 2 else now + reset
+            self._dirty = True
+
+    # サーバーから制限超過を返された
+    def exhaust(self, retry_after=None):
+        now = time.time()
+        with self._lock:
+            self._tokens = 0
+            self._updated = now
+            self._blocked_until = max(self._blocked_until, now + (retry_after if retry_after else 60))
+            self._dirty = True
+
+    # ファイルから読み込む
+    def load(self):
+        data = load_json(self._path, self.FORMAT_VERSION)
+        if data is None:
+            return False
+
+        with self._lock:
+            self._tokens = min(float(data['tokens']), float(self._limit))
+            self._updated = data['updated']
+            self._blocked_until = data.get('blocked_until', 0)
+            self._refill(time.time())
+            self._dirty = False
+        return True
+
+    # 変更があればファイルに保存する
+    def save(self):
+        if not self._path:
+            return False
+
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {
+                'tokens': self._tokens,
+                'updated': self._updated,
+                'blocked_until': self._blocked_until
+            }
+            self._dirty = False
+
+        save_json(self._path, data, self.FORMAT_VERSION)
+        return True
+
+    def _refill(self, now):
+        elapsed = max(now - self._updated, 0)
+        if self._limit > 0:
+            self._tokens = min(float(self._limit), self._tokens + elapsed * self._limit / self.PERIOD)
+        self._updated = now
+
+    @staticmethod
+    def _get_number(headers, name):
+        value = headers.get(name)
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
@@ -0,0 +1,111 @@
+import concurrent.futures
+import threading
+import time
+
+class ServiceUnavailable(Exception):
+    """
+    障害中と判断して問い合わせなかったことを表す例外
+    """
+
+    def __init__(self, retry_after=None):
+        super().__init__("Codic is unavailable{}".format(
+            " (retry after {:.0f}s)".format(retry_after) if retry_after else ""))
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    連続して失敗したら一定時間問い合わせを止めるサーキットブレーカー
+
+    failure_threshold 回連続で失敗すると cooldown 秒間は allow() が False を返す。
+    その後は1件だけ試行を許可し、成功すれば元に戻り、失敗すれば再び止める。
+    試行の結果が cooldown 秒経っても届かない場合は次の試行を許可する。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, cooldown=30):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0
+        self._probe_at = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    # 問い合わせてよいか
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+
+            now = time.monotonic()
+            if self._state == self.OPEN and now - self._opened_at >= self.cooldown:
+                # 復旧確認のため1件だけ通す
+                self._state = self.HALF_OPEN
+                self._probe_at = now
+                return True
+            if self._state == self.HALF_OPEN and now - self._probe_at >= self.cooldown:
+                self._probe_at = now
+                return True
+            return False
+
+    # 再開までの秒数
+    def retry_after(self):
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0
+            return max(self.cooldown - (time.monotonic() - self._opened_at), 0)
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+# 期限付きで実行し、hedge_delay 秒経っても終わらなければもう1回並行して実行する
+# 結果が決まった時点でまだ始まっていない方は取り消す（呼び出し元が諦めた後に送信しない）
+def hedged_call(executor, func, deadline, hedge_delay=0, can_hedge=None):
+    start = time.monotonic()
+    futures = [executor.submit(func)]
+
+    if hedge_delay and hedge_delay < deadline:
+        done, _ = concurrent.futures.wait(futures, timeout=hedge_delay)
+        if not done and (can_hedge is None or can_hedge()):
+            futures.append(executor.submit(func))
+
+    # 先に成功した方を使う（両方失敗したら最初の失敗を返す）
+    error = None
+    pending = set(futures)
+    while pending:
+        timeout = deadline - (time.monotonic() - start)
+        if timeout <= 0:
+            break
+        done, pending = concurrent.futures.wait(
+            pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                _cancel(pending)
+                return future.result()
+            error = error if error else future.exception()
+
+    if error and not pending:
+        raise error
+    _cancel(pending)
+    raise TimeoutError("Request timed out after {:.1f}s".format(deadline))
+
+# 実行待ちのものを取り消す（実行中のものは終わるまで止められない）
+def _cancel(futures):
+    for future in futures:
+        future.cancel()
@@ -0,0 +1,42 @@
+from concurrent.futures import Future
+import threading
+
+class SingleFlight:
+    """
+    同じキーの処理が実行中なら完了を待って結果を共有する
+
+    最初の呼び出し元だけが func を実行し、実行中に同じキーで呼ばれたものは
+    その結果（または例外）を受け取る。完了後はキーを破棄するので結果は保持しない。
+    """
+
+    def __init__(self):
+        # key -> Future
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    # 実行して (結果, 他の呼び出しと共有したか) を返す
+    def do(self, key, func):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                is_leader = False
+            else:
+                future = Future()
+                self._calls[key] = future
+                is_leader = True
+
+        if not is_leader:
+            return future.result(), True
+
+        try:
+            value = func()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+        return value, False
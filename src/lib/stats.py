@@ -0,0 +1,94 @@
+from collections import deque
+import threading
+import time
+
+class Stats:
+    """
+    処理の段階別の所要時間と発生回数の集計
+
+    所要時間は段階毎に直近 window 件だけ保持し、その中の分位点を求める。
+    回数は起動してからの累計。どちらもメモリ上にのみ持ち、保存しない。
+    """
+
+    # 表示する分位点
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, window=1000):
+        self._window = window
+        # phase -> deque(秒)
+        self._samples = {}
+        # phase -> 累計件数
+        self._totals = {}
+        # name -> 回数
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    # 所要時間を記録する
+    def record(self, phase, seconds):
+        with self._lock:
+            samples = self._samples.get(phase)
+            if samples is None:
+                samples = self._samples[phase] = deque(maxlen=self._window)
+            samples.append(seconds)
+            self._totals[phase] = self._totals.get(phase, 0) + 1
+
+    # with文で囲んだ処理の所要時間を記録する
+    def timer(self, phase):
+        return _Timer(self, phase)
+
+    # 回数を加算する
+    def increment(self, name, count=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    # 段階毎の累計件数と直近の分位点（秒）
+    def percentiles(self, phase):
+        with self._lock:
+            samples = sorted(self._samples.get(phase, ()))
+            total = self._totals.get(phase, 0)
+        if not samples:
+            return total, tuple(None for _ in self.PERCENTILES)
+        # 最近順位法（件数×p% を切り上げた順位の値）
+        return total, tuple(
+            samples[max((len(samples) * p + 99) // 100 - 1, 0)] for p in self.PERCENTILES)
+
+    def phases(self):
+        with self._lock:
+            return list(self._samples.keys())
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    # 表示用の行（段階毎の分位点と回数）
+    # phases を指定した場合はその順で、記録のない段階は除く
+    def format_lines(self, phases=None):
+        recorded = self.phases()
+        phases = [phase for phase in phases if phase in recorded] if phases else recorded
+        lines = []
+        for phase in phases:
+            total, values = self.percentiles(phase)
+            lines.append("{}: {} (n={})".format(phase, " / ".join(
+                "p{} {:.1f}ms".format(p, value * 1000) for p, value in zip(self.PERCENTILES, values)), total))
+        counters = self.counters()
+        for name in sorted(counters):
+            lines.append("{}: {}".format(name, counters[name]))
+        return lines
+
+class _Timer:
+    def __init__(self, stats, phase):
+        self._stats = stats
+        self._phase = phase
+        self._start = 0
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stats.record(self._phase, time.monotonic() - self._start)
+        return False
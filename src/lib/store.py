@@ -0,0 +1,24 @@
+import json
+import os
+
+# JSONファイルを読み込む（ファイルがない場合や version が違う場合はNone）
+def load_json(path, version=None):
+    if not path or not os.path.isfile(path):
+        return None
+
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    if version is not None and data.get('version') != version:
+        return None
+    return data
+
+# JSONファイルに保存する（version を指定した場合は data に含める）
+def save_json(path, data, version=None):
+    if version is not None:
+        data = dict(data, version=version)
+
+    # 途中で落ちても壊れないように一時ファイル経由で置き換える
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(temp_path, path)